@@ -0,0 +1,684 @@
+"""Benchmarks for the Ollama overlay.
+
+These run headless: Tk's event loop is replaced by a small fake scheduler so
+the numbers reflect how much work the overlay queues up, not the display server.
+
+    python bench_overlay.py render --tokens 2000 --rate 800
+    python bench_overlay.py client --requests 50
+    python bench_overlay.py history --messages 10000   (needs a display, e.g. xvfb-run)
+    python bench_overlay.py markdown --lines 5000
+    python bench_overlay.py prefetch --turns 8          (TTFT with and without speculative prefill)
+    python bench_overlay.py race --turns 10             (single model vs racing a fast and a slow server)
+    python bench_overlay.py transcript --messages 100000 (restore and search cost of the transcript log)
+    python bench_overlay.py suite                      (scripted conversations vs bench_baseline.json)
+    python bench_overlay.py suite --tk                 (drives the real window, e.g. under xvfb-run)
+"""
+import argparse
+import heapq
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from fake_ollama import serve_in_background
+from ollama_engine import SyncEngine
+from overlay_ollama import (DEFAULT_CONFIG, ChatView, Conversation, ExperimentalOverlay, MarkdownStreamFormatter,
+                            MetricsLog, PrefetchStats, RaceStats, TranscriptLog,
+                            RequestScheduler, StreamRenderer)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+REGRESSION_TOLERANCE = 0.25  # flag anything more than 25% worse than the baseline
+
+
+# --- Fake Tk ---
+
+class FakeRoot:
+    # Mimics root.after() and mainloop() closely enough to count callbacks
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = []
+        self.seq = 0
+        self.callbacks = 0
+
+    def after(self, ms, func, *args):
+        with self.lock:
+            self.seq += 1
+            heapq.heappush(self.pending, (time.perf_counter() + ms / 1000.0, self.seq, lambda: func(*args)))
+            return self.seq
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, job):
+        with self.lock:
+            self.pending = [entry for entry in self.pending if entry[1] != job]
+            heapq.heapify(self.pending)
+
+    def run_until(self, done, timeout=60.0):
+        deadline = time.perf_counter() + timeout
+        while not done() and time.perf_counter() < deadline:
+            with self.lock:
+                due = self.pending[0][0] if self.pending else None
+                func = None
+                if due is not None and due <= time.perf_counter():
+                    func = heapq.heappop(self.pending)[2]
+            if func is not None:
+                self.callbacks += 1
+                func()
+            else:
+                time.sleep(0.0005)
+
+
+class FakeChatView:
+    # Counts widget work; insert_cost simulates Text.insert + see(END)
+    def __init__(self, token_len, insert_cost=0.0):
+        self.token_len = token_len
+        self.insert_cost = insert_cost
+        self.inserts = 0
+        self.rendered = 0
+        self.render_times = []
+        self.finished = False
+
+    def _spin(self):
+        end = time.perf_counter() + self.insert_cost
+        while time.perf_counter() < end:
+            pass
+
+    def append_tokens(self, text):
+        self.inserts += 1
+        self._spin()
+        now = time.perf_counter()
+        count = len(text) // self.token_len
+        self.render_times.extend([now] * count)
+        self.rendered += count
+
+    def render_batch(self, ops):
+        for kind, _stream_id, text in ops:
+            if kind == "chunk":
+                self.append_tokens(text)
+            elif kind == "end":
+                self.finished = True
+
+
+class FakeVar:
+    def __init__(self, value=None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class FakeEntry:
+    def __init__(self):
+        self.text = ""
+
+    def get(self):
+        return self.text
+
+    def insert(self, index, text):
+        self.text += text
+
+    def delete(self, first, last=None):
+        self.text = ""
+
+
+class FakeWidget:
+    def config(self, **kwargs):
+        pass
+
+
+class RecordingChatView:
+    # Stands in for ChatView: counts the widget operations it would have done
+    # and keeps each streamed reply's text, to compare with the chat history
+    def __init__(self, keep_text=False):
+        self.inserts = 0
+        self.chars = 0
+        self.keep_text = keep_text
+        self.replies = {}  # stream_id -> text shown, when keep_text is set
+
+    def append(self, text, sender):
+        self.inserts += 1
+        self.chars += len(text)
+
+    def render_batch(self, ops):
+        for kind, stream_id, text in ops:
+            self.inserts += 1
+            self.chars += len(text)
+            if not self.keep_text:
+                continue
+            if kind == "start":
+                self.replies[stream_id] = ""
+            elif kind == "chunk" and stream_id in self.replies:
+                self.replies[stream_id] += text
+
+
+class HeadlessOverlay(ExperimentalOverlay):
+    # ExperimentalOverlay with its Tk widgets swapped for fakes; everything from
+    # send_message down (scheduler, engine, renderer, metrics) is the real code.
+    def __init__(self, base_url, model="fake-model", chat=True):
+        self.root = FakeRoot()
+        self.config = dict(DEFAULT_CONFIG)
+        self.transcript_path = None
+        self.selected_model = FakeVar(model)
+        self.chat_mode = FakeVar(chat)
+        self.use_cache = FakeVar(False)
+        self.cache_label = FakeVar("")
+        self.prefetch = FakeVar(False)
+        self.race_mode = FakeVar(False)
+        self.unload_previous = FakeVar(False)
+        self.model_status = FakeVar("")
+        self.model_status_label = FakeWidget()
+        self.user_entry = FakeEntry()
+        self.chat_view = RecordingChatView()
+        self.init_state()
+        self.renderer.start()
+        self.start_engine(SyncEngine(base_url=base_url))
+
+    def pump(self, done, timeout=60.0):
+        self.root.run_until(done, timeout)
+
+    def callbacks(self):
+        return self.root.callbacks
+
+    def close(self):
+        self.renderer.stop()
+        self.scheduler.shutdown()
+        self.race_scheduler.shutdown()
+        self.ollama.close()
+
+
+class TkOverlayDriver:
+    # Drives the real window (needs a display). Only UI-side flushes are counted
+    # as callbacks, since Tk doesn't expose a count of its own. Config and
+    # transcript live in a temp dir, away from the user's own.
+    def __init__(self, base_url):
+        os.environ["OLLAMA_HOST"] = base_url
+        self.tmp = tempfile.TemporaryDirectory()
+        self.overlay = ExperimentalOverlay(config_path=os.path.join(self.tmp.name, "config.json"),
+                                           transcript_path=os.path.join(self.tmp.name, "transcript.log"))
+
+    def __getattr__(self, name):
+        return getattr(self.overlay, name)
+
+    def pump(self, done, timeout=60.0):
+        deadline = time.perf_counter() + timeout
+        while not done() and time.perf_counter() < deadline:
+            self.overlay.root.update()
+            time.sleep(0.001)
+
+    def callbacks(self):
+        return self.overlay.renderer.flushes
+
+    def close(self):
+        self.overlay.on_close()
+        self.tmp.cleanup()
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def _produce(tokens, rate, token, emit, produced):
+    interval = 1.0 / rate if rate else 0.0
+    start = time.perf_counter()
+    for i in range(tokens):
+        if interval:
+            # Pace against the wall clock so slow emits don't stretch the run
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        produced.append(time.perf_counter())
+        emit(token)
+
+
+# --- Benchmarks ---
+
+def bench_render(tokens, rate, insert_cost_us, mode):
+    token = "tok "
+    root = FakeRoot()
+    view = FakeChatView(len(token), insert_cost_us / 1e6)
+    produced = []
+
+    if mode == "legacy":
+        # Old behaviour: one root.after(0, ...) per token
+        def emit(chunk):
+            root.after(0, lambda c=chunk: view.append_tokens(c))
+
+        def finish():
+            root.after(0, lambda: setattr(view, "finished", True))
+    else:
+        renderer = StreamRenderer(root, view)
+        renderer.start()
+
+        def emit(chunk):
+            renderer.post("chunk", "ai_stream", chunk)
+
+        def finish():
+            renderer.post("end", "ai_stream")
+
+    def producer():
+        _produce(tokens, rate, token, emit, produced)
+        finish()
+
+    started = time.perf_counter()
+    threading.Thread(target=producer, daemon=True).start()
+    root.run_until(lambda: view.finished)
+    total = time.perf_counter() - started
+
+    lags = [(r - p) * 1000.0 for p, r in zip(produced, view.render_times)]
+    return {
+        "mode": mode,
+        "tokens": tokens,
+        "callbacks": root.callbacks,
+        "inserts": view.inserts,
+        "lag_mean_ms": sum(lags) / len(lags) if lags else 0.0,
+        "lag_p95_ms": _percentile(lags, 95),
+        "lag_max_ms": max(lags) if lags else 0.0,
+        "tail_lag_ms": (view.render_times[-1] - produced[-1]) * 1000.0 if lags else 0.0,
+        "total_s": total,
+    }
+
+
+def bench_client(requests_count, connect_latency_ms, mode):
+    # Time-to-first-token against a local stub: a fresh connection per message
+    # (what one-off requests.post calls used to do) vs the pooled engine.
+    server = serve_in_background(tokens=20, connect_latency=connect_latency_ms / 1000.0)
+    engine = SyncEngine(base_url=server.url, pool_size=0 if mode == "oneshot" else 4)
+    ttfts = []
+    try:
+        for _ in range(requests_count):
+            started = time.perf_counter()
+            stream = engine.generate("fake", "hi")
+            next(stream)
+            ttfts.append((time.perf_counter() - started) * 1000.0)
+            for _chunk in stream:
+                pass
+    finally:
+        engine.close()
+        server.shutdown()
+        server.server_close()
+    return {
+        "mode": mode,
+        "requests": requests_count,
+        "connections": server.connections,
+        "ttft_mean_ms": sum(ttfts) / len(ttfts),
+        "ttft_p50_ms": _percentile(ttfts, 50),
+        "ttft_p95_ms": _percentile(ttfts, 95),
+    }
+
+
+def bench_history(messages, max_rendered, chunks_per_reply=20):
+    # Per-message insert latency (user line + streamed reply) as the session grows.
+    # Uses a real tk.Text, since layout and index lookups are what get slow.
+    import tkinter as tk
+
+    root = tk.Tk()
+    root.withdraw()
+    text = tk.Text(root, height=15, width=60, wrap="word")
+    text.pack()
+    view = ChatView(text, max_rendered=max_rendered)
+    checkpoints = sorted({c for c in (10, 100, 1000, 10000, messages) if c <= messages})
+    window = 10
+    samples = {}
+    timings = []
+    chunk = "lorem ipsum dolor sit amet " * 2
+    try:
+        for i in range(1, messages + 1):
+            started = time.perf_counter()
+            view.append(f"question {i}", "user")
+            view.render_batch([("start", "ai_stream", "")])
+            for _ in range(chunks_per_reply):
+                view.render_batch([("chunk", "ai_stream", chunk)])
+            view.render_batch([("end", "ai_stream", "")])
+            root.update_idletasks()
+            timings.append((time.perf_counter() - started) * 1000.0)
+            if i in checkpoints:
+                recent = timings[-window:]
+                samples[i] = sum(recent) / len(recent)
+        lines = int(text.index("end-1c").split(".")[0])
+    finally:
+        root.destroy()
+    result = {"mode": "bounded" if max_rendered else "unbounded", "widget_lines": lines}
+    result.update({f"msg{n}_ms": ms for n, ms in samples.items()})
+    return result
+
+
+def bench_markdown(lines, chunk_chars, mode):
+    # Per-chunk formatting cost as one reply grows. "incremental" feeds only the
+    # new chunk; "rescan" re-formats the whole reply so far, as a naive
+    # re-highlight after every chunk would.
+    block = ("Here is the approach, using a `dict` for lookups:\n"
+             "```python\n"
+             "def lookup(table, key):\n"
+             "    if key in table:\n"
+             "        return table[key]\n"
+             "    return None\n"
+             "```\n")
+    block_lines = block.count("\n")
+    reply = block * (lines // block_lines + 1)
+    chunks = [reply[i:i + chunk_chars] for i in range(0, len(reply), chunk_chars)]
+    checkpoints = {}
+    formatter = MarkdownStreamFormatter()
+    received = []
+    line_count = 0
+    window = []
+    targets = [t for t in (100, 1000, 5000, lines) if t <= lines]
+    for chunk in chunks:
+        started = time.perf_counter()
+        if mode == "incremental":
+            formatter.feed(chunk)
+        else:
+            received.append(chunk)
+            fresh = MarkdownStreamFormatter()
+            fresh.feed("".join(received))
+            fresh.flush()
+        window.append((time.perf_counter() - started) * 1e6)
+        window = window[-50:]
+        line_count += chunk.count("\n")
+        while targets and line_count >= targets[0]:
+            checkpoints[f"line{targets.pop(0)}_us"] = sum(window) / len(window)
+        if not targets:
+            break
+    return dict({"mode": mode, "chunk_chars": chunk_chars}, **checkpoints)
+
+
+def bench_conversation(turns, tokens, rate, chunk_size, first_token_latency_ms, use_tk=False, chat=True):
+    # A scripted conversation through the whole overlay against the fake server
+    server = serve_in_background(tokens=tokens, rate=rate, chunk_size=chunk_size,
+                                 first_token_latency=first_token_latency_ms / 1000.0)
+    driver = TkOverlayDriver(server.url) if use_tk else HeadlessOverlay(server.url, chat=chat)
+    tracemalloc.start()
+    try:
+        # One warm-up turn so imports and the first connection don't count
+        driver.user_entry.insert(0, "warm up")
+        driver.send_message()
+        driver.pump(lambda: len(driver.metrics.records) >= 1)
+        driver.metrics.records.clear()
+        callbacks_before = driver.callbacks()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        for turn in range(turns):
+            driver.user_entry.insert(0, f"Scripted question {turn}: explain consistent hashing")
+            driver.send_message()
+            driver.pump(lambda: len(driver.metrics.records) >= turn + 1)
+        callbacks = driver.callbacks() - callbacks_before
+        memory_growth = tracemalloc.get_traced_memory()[0] - memory_before
+    finally:
+        tracemalloc.stop()
+        driver.close()
+        server.shutdown()
+        server.server_close()
+    records = list(driver.metrics.records)
+    errors = [r["error"] for r in records if r["error"]]
+    if errors:
+        raise RuntimeError(f"{len(errors)} generations failed, first: {errors[0]}")
+    ttfts = [r["ttft_ms"] for r in records if r["ttft_ms"] is not None]
+    lags = [r["render_lag_mean_ms"] for r in records if r["render_lag_mean_ms"] is not None]
+    return {
+        "turns": len(records),
+        "ttft_p50_ms": _percentile(ttfts, 50),
+        "ttft_p95_ms": _percentile(ttfts, 95),
+        "render_lag_mean_ms": sum(lags) / len(lags) if lags else 0.0,
+        "callbacks_per_response": callbacks / max(1, len(records)),
+        "memory_growth_kb": memory_growth / 1024.0,
+    }
+
+
+def bench_prefetch(turns, prefill_rate, think_ms, mode, words_per_sec=5.0):
+    # Types each message word by word, pauses, then presses Enter. The stub
+    # charges prefill for the uncached part of the prompt, so a warmed draft
+    # shows up as lower time-to-first-token.
+    server = serve_in_background(tokens=40, rate=0, chunk_size=4, prefill_rate=prefill_rate)
+    driver = HeadlessOverlay(server.url)
+    driver.prefetch.set(mode == "on")
+    try:
+        for turn in range(turns):
+            for word in f"Question {turn}: compare B-trees and LSM trees for a write heavy workload".split():
+                driver.user_entry.insert("end", word + " ")
+                driver.on_draft_change()
+                driver.pump(lambda: False, timeout=1.0 / words_per_sec)
+            driver.pump(lambda: False, timeout=think_ms / 1000.0)
+            driver.send_message()
+            driver.pump(lambda: len(driver.metrics.records) >= turn + 1)
+    finally:
+        driver.close()
+        server.shutdown()
+        server.server_close()
+    records = list(driver.metrics.records)
+    ttfts = [r["ttft_ms"] for r in records if r["ttft_ms"] is not None]
+    stats = driver.prefetch_stats
+    return {
+        "mode": mode,
+        "turns": len(records),
+        "ttft_p50_ms": _percentile(ttfts, 50),
+        "ttft_p95_ms": _percentile(ttfts, 95),
+        "drafts": stats.issued,
+        "hits": stats.hits,
+        "partial": stats.partial,
+        "misses": stats.misses,
+        "wasted": stats.wasted,
+        "wasted_prompt_tokens": stats.wasted_prompt_tokens,
+    }
+
+
+def bench_race(turns, win_tokens, mode):
+    # "single" asks only the slow server; "race" also asks a fast one over the
+    # OpenAI-compatible API and keeps whichever streams first. In "overtake" the
+    # local server answers first but decodes slowly, so the remote one shown
+    # second reaches race_win_tokens first and has to take over the display.
+    if mode == "overtake":
+        slow = serve_in_background(tokens=60, rate=100, first_token_latency=0.02)
+        fast = serve_in_background(tokens=60, rate=2000, first_token_latency=0.1)
+    else:
+        slow = serve_in_background(tokens=60, rate=200, first_token_latency=0.12)
+        fast = serve_in_background(tokens=60, rate=800, first_token_latency=0.03)
+    driver = HeadlessOverlay(slow.url)
+    driver.chat_view = RecordingChatView(keep_text=True)
+    if mode != "single":
+        driver.race_mode.set(True)
+        driver.config["race_targets"] = ["fake-model",
+                                         {"name": "fast", "url": fast.url + "/v1", "model": "fake-model",
+                                          "api": "openai"}]
+        driver.config["race_win_tokens"] = win_tokens
+    per_turn = 1 if mode == "single" else 2
+    try:
+        for turn in range(turns):
+            driver.user_entry.insert(0, f"Race question {turn}")
+            driver.send_message()
+            driver.pump(lambda: len(driver.metrics.records) >= (turn + 1) * per_turn)
+    finally:
+        driver.close()
+        for server in (slow, fast):
+            server.shutdown()
+            server.server_close()
+    # Time to the first token on screen: the earliest contestant of each turn
+    records = list(driver.metrics.records)
+    ttfts = []
+    for turn in range(turns):
+        firsts = [r["ttft_ms"] for r in records[turn * per_turn:(turn + 1) * per_turn] if r["ttft_ms"] is not None]
+        if firsts:
+            ttfts.append(min(firsts))
+    wins = {name: stats["wins"] for name, stats in driver.race_stats.targets.items()}
+    # Every answer kept in the history must be the text that was left on screen
+    shown = set(driver.chat_view.replies.values())
+    answers = [m["content"] for m in driver.conversation.messages() if m["role"] == "assistant"]
+    mismatched = sum(answer not in shown for answer in answers)
+    return {
+        "mode": mode,
+        "turns": turns,
+        "ttft_p50_ms": _percentile(ttfts, 50),
+        "total_ms_p50": _percentile([r["total_ms"] for r in records if r["race"] != "lost"], 50),
+        "server_cancelled": slow.cancelled + fast.cancelled,
+        "wins": " ".join(f"{name}:{count}" for name, count in sorted(wins.items())) or "-",
+        "shown_vs_history": f"{len(answers) - mismatched}/{len(answers)} match",
+    }
+
+
+def bench_transcript(messages, restore, mode):
+    # "log" reopens through the index and maps only the tail; "full" is the
+    # naive restore that decodes the whole history and keeps the last few.
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "transcript.log")
+        log = TranscriptLog(path)
+        body = "Consistent hashing maps keys and nodes onto the same ring so that " * 4
+        started = time.perf_counter()
+        for i in range(messages):
+            log.append({"time": time.time(), "sender": "user" if i % 2 == 0 else "ai", "text": f"{i} {body}",
+                        "meta": {"model": "fake-model", "eval_count": 120, "ttft_ms": 85.5}})
+        append_us = (time.perf_counter() - started) / messages * 1e6
+        log.close()
+        size_mb = os.path.getsize(path) / 1e6
+        tracemalloc.start()
+        started = time.perf_counter()
+        if mode == "log":
+            log = TranscriptLog(path)
+            records = log.tail(restore)
+        else:
+            import struct
+            records = []
+            with open(path, "rb") as f:
+                data = f.read()
+            offset = 0
+            while offset < len(data):
+                (length,) = struct.unpack_from("<I", data, offset)
+                records.append(json.loads(data[offset + 4:offset + 4 + length]))
+                offset += 4 + length
+            records = records[-restore:]
+        restore_ms = (time.perf_counter() - started) * 1000.0
+        peak_kb = tracemalloc.get_traced_memory()[1] / 1024.0
+        tracemalloc.stop()
+        search_ms = None
+        if mode == "log":
+            started = time.perf_counter()
+            log.search(f"{messages - 5} Consistent")
+            search_ms = (time.perf_counter() - started) * 1000.0
+            log.close()
+        assert len(records) == min(restore, messages)
+    return {"mode": mode, "messages": messages, "log_mb": size_mb, "append_us": append_us,
+            "restore_ms": restore_ms, "restore_peak_kb": peak_kb, "search_ms": search_ms}
+
+
+def run_suite(use_tk=False):
+    # Fixed scenarios so results are comparable run to run
+    scenarios = {
+        "chat_fast_model": dict(turns=20, tokens=400, rate=0, chunk_size=1, first_token_latency_ms=5),
+        "chat_paced_model": dict(turns=5, tokens=200, rate=400, chunk_size=1, first_token_latency_ms=50),
+        "generate_chunked": dict(turns=10, tokens=400, rate=0, chunk_size=8, first_token_latency_ms=5, chat=False),
+    }
+    results = {}
+    for name, params in scenarios.items():
+        results[name] = bench_conversation(use_tk=use_tk, **params)
+        _print_row(dict(scenario=name, **results[name]))
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    # Every reported number is "lower is better"; small absolute values are
+    # noise-dominated, so differences under 1 unit are never flagged.
+    regressions = []
+    for scenario, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(scenario, {}).get(metric)
+            if base is None or metric == "turns":
+                continue
+            if value > base * (1 + tolerance) and value - base > 1.0:
+                regressions.append(f"{scenario}.{metric}: {value:.2f} vs baseline {base:.2f}")
+    return regressions
+
+
+def _print_row(result):
+    print("  ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in result.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    render = sub.add_parser("render", help="Tk callbacks and render lag per streamed response")
+    render.add_argument("--tokens", type=int, default=2000)
+    render.add_argument("--rate", type=float, default=800.0, help="tokens per second (0 = as fast as possible)")
+    render.add_argument("--insert-cost-us", type=float, default=200.0, help="simulated cost of one Text insert")
+
+    client = sub.add_parser("client", help="time-to-first-token with and without the pooled client")
+    client.add_argument("--requests", type=int, default=50)
+    client.add_argument("--connect-latency-ms", type=float, default=2.0,
+                        help="extra cost the stub adds to every new TCP connection")
+
+    history = sub.add_parser("history", help="insert latency from message 10 to message N")
+    history.add_argument("--messages", type=int, default=10000)
+    history.add_argument("--max-rendered", type=int, default=200)
+    history.add_argument("--skip-unbounded", action="store_true", help="only run the bounded view")
+
+    markdown = sub.add_parser("markdown", help="per-chunk cost of code/markdown tagging as a reply grows")
+    markdown.add_argument("--lines", type=int, default=5000)
+    markdown.add_argument("--chunk-chars", type=int, default=12)
+
+    prefetch = sub.add_parser("prefetch", help="time-to-first-token with and without speculative prefill")
+    prefetch.add_argument("--turns", type=int, default=8)
+    prefetch.add_argument("--prefill-rate", type=float, default=1500.0, help="stub prompt tokens per second")
+    prefetch.add_argument("--think-ms", type=float, default=600.0, help="pause between the last word and Enter")
+
+    race = sub.add_parser("race", help="time-to-first-token for one model vs racing two servers")
+    race.add_argument("--turns", type=int, default=10)
+    race.add_argument("--win-tokens", type=int, default=12)
+
+    transcript = sub.add_parser("transcript", help="append, restore and search cost of the transcript log")
+    transcript.add_argument("--messages", type=int, default=100000)
+    transcript.add_argument("--restore", type=int, default=60, help="messages brought back on startup")
+
+    suite = sub.add_parser("suite", help="scripted conversations through the overlay, compared to a baseline")
+    suite.add_argument("--tk", action="store_true", help="drive the real Tk window instead of the headless fakes")
+    suite.add_argument("--baseline", default=BASELINE_PATH)
+    suite.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+
+    args = parser.parse_args()
+    if args.bench == "render":
+        for mode in ("legacy", "pipeline"):
+            _print_row(bench_render(args.tokens, args.rate, args.insert_cost_us, mode))
+    elif args.bench == "client":
+        for mode in ("oneshot", "pooled"):
+            _print_row(bench_client(args.requests, args.connect_latency_ms, mode))
+    elif args.bench == "history":
+        _print_row(bench_history(args.messages, args.max_rendered))
+        if not args.skip_unbounded:
+            _print_row(bench_history(args.messages, None))
+    elif args.bench == "markdown":
+        for mode in ("incremental", "rescan"):
+            _print_row(bench_markdown(args.lines, args.chunk_chars, mode))
+    elif args.bench == "prefetch":
+        for mode in ("off", "on"):
+            _print_row(bench_prefetch(args.turns, args.prefill_rate, args.think_ms, mode))
+    elif args.bench == "race":
+        for mode in ("single", "race", "overtake"):
+            _print_row(bench_race(args.turns, args.win_tokens, mode))
+    elif args.bench == "transcript":
+        for mode in ("log", "full"):
+            _print_row(bench_transcript(args.messages, args.restore, mode))
+    elif args.bench == "suite":
+        results = run_suite(use_tk=args.tk)
+        if args.save_baseline:
+            with open(args.baseline, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            print(f"Baseline saved to {args.baseline}")
+        elif os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                regressions = compare_to_baseline(results, json.load(f))
+            for line in regressions:
+                print(f"REGRESSION {line}")
+            if regressions:
+                sys.exit(1)
+            print("No regressions against baseline.")
+        else:
+            print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+
+
+if __name__ == "__main__":
+    main()
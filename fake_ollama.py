@@ -0,0 +1,222 @@
+"""Minimal stand-in for the Ollama HTTP API, used by the benchmarks.
+
+Implements /api/generate and /api/chat (NDJSON streaming over chunked HTTP/1.1
+with keep-alive, like the real server), the OpenAI-compatible
+/v1/chat/completions (SSE) plus /api/tags and /api/ps, with a
+configurable token rate, tokens per chunk and latencies. Optionally prompt
+prefill is charged too, with a per-model prefix cache like Ollama's KV cache.
+No GPU or model needed.
+
+    python fake_ollama.py --port 11434 --tokens 200 --rate 100 --chunk-size 2
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled clients can reuse sockets
+    disable_nagle_algorithm = True  # TCP_NODELAY, as Go's net/http (and so Ollama) sets it
+
+    def setup(self):
+        # Runs once per TCP connection: models the cost of a fresh connect
+        if self.server.connect_latency:
+            time.sleep(self.server.connect_latency)
+        self.server.connections += 1
+        super().setup()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else {}
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, payload):
+        if self.sse:
+            data = ("data: " + (payload if isinstance(payload, str) else json.dumps(payload)) + "\n\n").encode()
+        else:
+            data = (json.dumps(payload) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        server = self.server
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": name, "model": name} for name in server.models]})
+        elif self.path == "/api/ps":
+            self._send_json(200, {"models": [{"name": name, "model": name, "size": server.model_size(name),
+                                              "size_vram": 0} for name in sorted(server.loaded)]})
+        else:
+            self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        payload = self._read_json()
+        server = self.server
+        model = payload.get("model")
+        server.requests.append((self.path, payload))
+        if payload.get("options"):
+            server.model_options[model] = payload["options"]
+        self.sse = False
+        if self.path == "/api/generate":
+            if not payload.get("prompt"):
+                # Empty prompt = load/unload only, like the real server
+                if payload.get("keep_alive") in (0, "0"):
+                    server.loaded.discard(model)
+                else:
+                    server.loaded.add(model)
+                self._send_json(200, {"model": model, "response": "", "done": True})
+                return
+            prompt = payload["prompt"]
+            make_message = lambda text, done: {"model": model, "response": text, "done": done}
+        elif self.path == "/api/chat":
+            prompt = "".join(f"{m.get('role')}:{m.get('content')}\n" for m in payload.get("messages", []))
+            make_message = lambda text, done: {"model": model, "message": {"role": "assistant", "content": text},
+                                               "done": done}
+        elif self.path == "/v1/chat/completions":
+            prompt = "".join(f"{m.get('role')}:{m.get('content')}\n" for m in payload.get("messages", []))
+            make_message = lambda text, done: {"object": "chat.completion.chunk", "model": model, "choices": [
+                {"index": 0, "delta": {"content": text}, "finish_reason": "stop" if done else None}]}
+            self.sse = True
+        else:
+            self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+            return
+        server.loaded.add(model)
+        tokens = server.tokens
+        num_predict = (payload.get("options") or {}).get("num_predict", payload.get("max_tokens"))
+        if num_predict is not None and num_predict >= 0:
+            tokens = min(tokens, num_predict)
+        if payload.get("stream", True):
+            self._stream(make_message, model, prompt, tokens)
+        else:
+            prompt_tokens, prefill = self._prefill(model, prompt)
+            text = "".join(f"tok{i} " for i in range(tokens))
+            self._send_json(200, dict(make_message(text, True), **self._timings(tokens, 0.0, prompt_tokens, prefill)))
+
+    def _prefill(self, model, prompt):
+        # Only the part of the prompt not shared with this model's previous
+        # prompt is evaluated (and charged), as with Ollama's KV cache reuse.
+        # Returns (prompt tokens evaluated, seconds spent).
+        server = self.server
+        with server.model_locks[model]:
+            cached = len(os.path.commonprefix([server.kv_cache.get(model, ""), prompt]))
+            prompt_tokens = max(1, (len(prompt) - cached) // 4)
+            elapsed = prompt_tokens / server.prefill_rate if server.prefill_rate else 0.0
+            if elapsed:
+                time.sleep(elapsed)
+            server.kv_cache[model] = prompt
+        return prompt_tokens, elapsed
+
+    @staticmethod
+    def _timings(tokens, elapsed, prompt_tokens=1, prefill=0.0):
+        return {"eval_count": tokens, "eval_duration": int(elapsed * 1e9), "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prefill * 1e9), "load_duration": 0,
+                "total_duration": int((elapsed + prefill) * 1e9)}
+
+    def _stream(self, make_message, model, prompt, tokens):
+        server = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if self.sse else "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        if server.first_token_latency:
+            time.sleep(server.first_token_latency)
+        prompt_tokens, prefill = self._prefill(model, prompt)
+        interval = server.chunk_size / server.rate if server.rate else 0.0
+        started = time.perf_counter()
+        try:
+            for n, i in enumerate(range(0, tokens, server.chunk_size)):
+                if interval:
+                    delay = started + n * interval - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                text = "".join(f"tok{j} " for j in range(i, min(i + server.chunk_size, tokens)))
+                self._write_chunk(make_message(text, False))
+            final = make_message("", True)
+            final.update(self._timings(tokens, time.perf_counter() - started, prompt_tokens, prefill))
+            self._write_chunk(final)
+            if self.sse:
+                self._write_chunk("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled mid-stream
+            server.cancelled += 1
+            self.close_connection = True
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), tokens=50, rate=0.0, chunk_size=1, first_token_latency=0.0,
+                 connect_latency=0.0, models=("fake-model",), prefill_rate=0.0):
+        super().__init__(address, FakeOllamaHandler)
+        self.tokens = tokens
+        self.rate = rate
+        self.chunk_size = max(1, chunk_size)
+        self.first_token_latency = first_token_latency
+        self.connect_latency = connect_latency
+        self.models = list(models)
+        self.prefill_rate = prefill_rate  # prompt tokens per second (0 = free)
+        self.kv_cache = {}  # model -> last prompt
+        self.model_options = {}  # model -> options of its last request, for /api/ps sizes
+        self.model_locks = defaultdict(threading.Lock)
+        self.loaded = set()
+        self.requests = []  # (path, payload) for every POST, for assertions in benchmarks
+        self.connections = 0
+        self.cancelled = 0
+
+    def model_size(self, model):
+        # Rough stand-in for weights plus a KV cache that grows with num_ctx
+        num_ctx = self.model_options.get(model, {}).get("num_ctx", 2048)
+        return 400 * 1024 * 1024 + num_ctx * 128 * 1024
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def serve_in_background(**kwargs):
+    server = FakeOllamaServer(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per response")
+    parser.add_argument("--rate", type=float, default=0.0, help="tokens per second (0 = unthrottled)")
+    parser.add_argument("--chunk-size", type=int, default=1, help="tokens per NDJSON line")
+    parser.add_argument("--first-token-latency", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--connect-latency", type=float, default=0.0, help="seconds added to every new connection")
+    parser.add_argument("--prefill-rate", type=float, default=0.0,
+                        help="uncached prompt tokens evaluated per second (0 = free)")
+    args = parser.parse_args()
+    server = FakeOllamaServer((args.host, args.port), tokens=args.tokens, rate=args.rate, chunk_size=args.chunk_size,
+                              first_token_latency=args.first_token_latency, connect_latency=args.connect_latency,
+                              prefill_rate=args.prefill_rate)
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+"""Ollama streaming engine, independent of any UI.
+
+Async API (one event loop can run many streams at once, no thread per request):
+
+    engine = OllamaEngine()
+    async for chunk in engine.chat("qwen3:0.6b", [{"role": "user", "content": "hi"}]):
+        print(chunk.text, end="")
+
+SyncEngine wraps it on a background event loop for threaded/Tk callers, and
+the module doubles as a headless CLI:
+
+    python ollama_engine.py -m qwen3:0.6b "Why is the sky blue?"
+
+HTTP is a small keep-alive HTTP/1.1 client on asyncio streams (plain HTTP, or
+TLS for https:// URLs, e.g. Ollama behind a reverse proxy), so there are no
+third-party dependencies. openai_chat() speaks the
+OpenAI-compatible /v1/chat/completions stream (SSE) that llama.cpp, vLLM,
+LM Studio and Ollama itself serve.
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import os
+import queue
+import sys
+import threading
+from urllib.parse import urlsplit
+
+CONNECT_TIMEOUT = 3.05  # seconds to establish the TCP connection
+READ_TIMEOUT = 120      # seconds between bytes once connected (model load can be slow)
+
+
+def default_url():
+    # Reads OLLAMA_HOST with the ollama CLI's defaults: no scheme means http
+    # on port 11434, an explicit http:// or https:// defaults to 80 / 443.
+    # The server's usual bind-all address is dialled as localhost instead. A
+    # bare IPv6 address (e.g. "::1") is, like in the CLI, all host.
+    value = os.environ.get("OLLAMA_HOST", "").strip() or "127.0.0.1:11434"
+    scheme, sep, rest = value.partition("://")
+    if not sep:
+        scheme, rest, port = "http", value, 11434
+    else:
+        port = 443 if scheme == "https" else 80
+    hostport, _, path = rest.partition("/")
+    try:
+        host = str(ipaddress.ip_address(hostport))
+    except ValueError:
+        parts = urlsplit(f"{scheme}://{hostport}")
+        host = parts.hostname or "127.0.0.1"
+        port = parts.port or port
+    if host in ("0.0.0.0", "::"):
+        host = "127.0.0.1"
+    if ":" in host:
+        host = f"[{host}]"
+    return f"{scheme}://{host}:{port}" + (f"/{path}".rstrip("/") if path else "")
+
+
+class OllamaError(Exception):
+    def __init__(self, status, body=""):
+        super().__init__(f"Ollama error: {status}" + (f" {body}" if body else ""))
+        self.status = status
+        self.body = body
+
+
+# --- NDJSON ---
+
+class NDJSONParser:
+    # Incremental: feed raw bytes as they arrive, get back every complete line
+    # decoded. Partial lines stay buffered; nothing is decoded to str first.
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        end = self.buffer.rfind(b"\n")
+        if end < 0:
+            return []
+        lines = self.buffer[:end].split(b"\n")
+        del self.buffer[:end + 1]
+        return self._decode(lines)
+
+    def flush(self):
+        lines, self.buffer = [bytes(self.buffer)], bytearray()
+        return self._decode(lines)
+
+    @staticmethod
+    def _decode(lines):
+        messages = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                messages.append(json.loads(line))
+            except ValueError as e:
+                print(f"Streaming parse error: {e}, line: {line[:200]!r}")
+        return messages
+
+
+class SSEParser(NDJSONParser):
+    # Server-sent events as sent by OpenAI-compatible servers: only the
+    # "data: {...}" lines matter; comments, other fields and the closing
+    # "data: [DONE]" are dropped.
+    @staticmethod
+    def _decode(lines):
+        payloads = []
+        for line in lines:
+            line = line.strip()
+            if line.startswith(b"data:"):
+                data = line[5:].strip()
+                if data and data != b"[DONE]":
+                    payloads.append(data)
+        return NDJSONParser._decode(payloads)
+
+
+class Chunk:
+    __slots__ = ("text", "done", "data")
+
+    def __init__(self, text, done, data):
+        self.text = text
+        self.done = done
+        self.data = data  # the raw message; the final one carries Ollama's timings
+
+
+# --- HTTP/1.1 over asyncio streams ---
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def close(self):
+        if not self.writer.is_closing():
+            self.writer.close()
+
+
+class Response:
+    def __init__(self, pool, connection, status, headers, read_timeout):
+        self.pool = pool
+        self.connection = connection
+        self.status = status
+        self.headers = headers
+        self.read_timeout = read_timeout
+        self.closed = False
+
+    async def _read(self, coro):
+        return await asyncio.wait_for(coro, self.read_timeout)
+
+    async def iter_bytes(self):
+        reader = self.connection.reader
+        try:
+            if self.headers.get("transfer-encoding", "").lower() == "chunked":
+                while True:
+                    size_line = await self._read(reader.readline())
+                    if not size_line:
+                        raise ConnectionResetError("connection closed mid-response")
+                    size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                    if size == 0:
+                        # Trailers (normally none) end with a blank line
+                        while (await self._read(reader.readline())).strip():
+                            pass
+                        break
+                    data = await self._read(reader.readexactly(size))
+                    await self._read(reader.readexactly(2))
+                    yield data
+            elif "content-length" in self.headers:
+                remaining = int(self.headers["content-length"])
+                while remaining > 0:
+                    data = await self._read(reader.read(min(remaining, 65536)))
+                    if not data:
+                        raise ConnectionResetError("connection closed mid-response")
+                    remaining -= len(data)
+                    yield data
+            else:
+                while True:
+                    data = await self._read(reader.read(65536))
+                    if not data:
+                        break
+                    yield data
+                self.headers["connection"] = "close"
+        except BaseException:
+            # Cancelled or failed mid-body: the socket is in an unknown state
+            self.close(reusable=False)
+            raise
+        self.close(reusable=True)
+
+    async def read(self):
+        return b"".join([data async for data in self.iter_bytes()])
+
+    async def json(self):
+        return json.loads(await self.read() or b"{}")
+
+    def close(self, reusable=False):
+        if self.closed:
+            return
+        self.closed = True
+        if reusable and self.headers.get("connection", "").lower() != "close":
+            self.pool.release(self.connection)
+        else:
+            self.connection.close()
+
+
+class ConnectionPool:
+    # Keep-alive sockets to one host, reused across requests on the same loop
+    def __init__(self, host, port, size, connect_timeout, tls=None):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self.tls = tls  # ssl.SSLContext for https endpoints
+        self.idle = []
+
+    async def acquire(self):
+        while self.idle:
+            connection = self.idle.pop()
+            if not connection.writer.is_closing() and not connection.reader.at_eof():
+                connection.reused = True
+                return connection
+            connection.close()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port, ssl=self.tls),
+                                                self.connect_timeout)
+        return _Connection(reader, writer)
+
+    def release(self, connection):
+        if len(self.idle) < self.size:
+            self.idle.append(connection)
+        else:
+            connection.close()
+
+    def close(self):
+        for connection in self.idle:
+            connection.close()
+        self.idle = []
+
+
+# --- Engine ---
+# Ollama option name -> OpenAI request field; other options have no OpenAI
+# equivalent and are not sent (some servers reject unknown fields)
+OPENAI_OPTION_NAMES = {"num_predict": "max_tokens", "temperature": "temperature", "top_p": "top_p",
+                       "seed": "seed", "stop": "stop", "presence_penalty": "presence_penalty",
+                       "frequency_penalty": "frequency_penalty"}
+
+
+class OllamaEngine:
+    def __init__(self, base_url=None, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 retries=2, backoff=0.25, pool_size=4, api_key=None):
+        self.base_url = (base_url or default_url()).rstrip("/")
+        parts = urlsplit(self.base_url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Ollama URL must start with http:// or https://, got {self.base_url}")
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        tls = None
+        if parts.scheme == "https":
+            import ssl  # only paid for by https endpoints
+            tls = ssl.create_default_context()
+        self.path_prefix = parts.path.rstrip("/")  # e.g. "/v1" for an OpenAI-style base URL
+        self.api_key = api_key
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool = ConnectionPool(self.host, self.port, pool_size, connect_timeout, tls)
+
+    async def request(self, method, path, payload=None, on_connect=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        auth = f"Authorization: Bearer {self.api_key}\r\n" if self.api_key else ""
+        head = (f"{method} {self.path_prefix}{path} HTTP/1.1\r\n"
+                f"Host: {f'[{self.host}]' if ':' in self.host else self.host}:{self.port}\r\n"
+                "Content-Type: application/json\r\n"
+                "Accept: application/x-ndjson, text/event-stream, application/json\r\n"
+                f"{auth}"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: keep-alive\r\n\r\n").encode("latin-1")
+        for attempt in range(self.retries + 1):
+            connection = await self.pool.acquire()
+            if on_connect is not None:
+                # Socket ready (new or reused); Ollama only sends headers with the first token
+                on_connect(connection)
+            try:
+                connection.writer.write(head + body)
+                await connection.writer.drain()
+                status_line = await asyncio.wait_for(connection.reader.readline(), self.read_timeout)
+                if not status_line:
+                    raise ConnectionResetError("connection closed before response")
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(connection.reader.readline(), self.read_timeout)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                status = int(status_line.split()[1])
+                return Response(self.pool, connection, status, headers, self.read_timeout)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                # Typically a pooled keep-alive socket that Ollama already closed
+                # (connection reset); nothing was generated yet, so retrying is safe.
+                connection.close()
+                if attempt == self.retries:
+                    raise
+                delay = 0 if connection.reused and attempt == 0 else self.backoff * (2 ** attempt)
+                print(f"Ollama connection error ({e!r}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            except BaseException:
+                connection.close()
+                raise
+
+    async def stream(self, path, payload, on_connect=None, parser=NDJSONParser):
+        # Yields every NDJSON (or SSE) message of a streaming endpoint; cancelling
+        # the consuming task closes the socket, which makes Ollama stop generating.
+        response = await self.request("POST", path, payload, on_connect)
+        try:
+            if response.status != 200:
+                raise OllamaError(response.status, (await response.read()).decode("utf-8", "replace")[:200])
+            parser = parser()
+            async for data in response.iter_bytes():
+                for message in parser.feed(data):
+                    yield message
+            for message in parser.flush():
+                yield message
+        finally:
+            response.close()
+
+    @staticmethod
+    def _payload(model, options, keep_alive, extra):
+        payload = {"model": model}
+        if options:
+            payload["options"] = options
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        payload.update(extra)
+        return payload
+
+    async def generate(self, model, prompt, options=None, keep_alive=None, on_connect=None, **extra):
+        payload = self._payload(model, options, keep_alive, extra)
+        payload["prompt"] = prompt
+        async for message in self.stream("/api/generate", payload, on_connect):
+            yield Chunk(message.get("response", ""), bool(message.get("done")), message)
+
+    async def chat(self, model, messages, options=None, keep_alive=None, on_connect=None, **extra):
+        payload = self._payload(model, options, keep_alive, extra)
+        payload["messages"] = messages
+        async for message in self.stream("/api/chat", payload, on_connect):
+            yield Chunk((message.get("message") or {}).get("content", ""), bool(message.get("done")), message)
+
+    async def openai_chat(self, model, messages, options=None, on_connect=None, **extra):
+        payload = {"model": model, "messages": messages, "stream": True}
+        for name, value in (options or {}).items():
+            if name in OPENAI_OPTION_NAMES:
+                payload[OPENAI_OPTION_NAMES[name]] = value
+        payload.update(extra)
+        path = "/chat/completions" if self.path_prefix.endswith("/v1") else "/v1/chat/completions"
+        async for message in self.stream(path, payload, on_connect, parser=SSEParser):
+            choice = (message.get("choices") or [{}])[0]
+            yield Chunk((choice.get("delta") or {}).get("content") or "", choice.get("finish_reason") is not None,
+                        message)
+
+    async def call(self, method, path, payload=None):
+        response = await self.request(method, path, payload)
+        body = await response.read()
+        if response.status != 200:
+            raise OllamaError(response.status, body.decode("utf-8", "replace")[:200])
+        return json.loads(body or b"{}")
+
+    async def preload(self, model, keep_alive=None, options=None):
+        # An empty prompt makes Ollama load (or, with keep_alive=0, unload) the
+        # model without generating anything. Pass the options later requests
+        # will use: a different num_ctx or num_thread makes Ollama reload.
+        payload = self._payload(model, options, keep_alive, {"stream": False})
+        await self.call("POST", "/api/generate", payload)
+
+    async def ps(self):
+        # Loaded models with their memory use ("size", "size_vram", in bytes)
+        return (await self.call("GET", "/api/ps")).get("models", [])
+
+    async def running_models(self):
+        return [m.get("name") for m in await self.ps()]
+
+    async def installed_models(self):
+        return [m.get("name") for m in (await self.call("GET", "/api/tags")).get("models", [])]
+
+    async def aclose(self):
+        self.pool.close()
+
+
+class SyncEngine:
+    # Runs an OllamaEngine on a private event-loop thread. submit() schedules a
+    # coroutine and returns a concurrent.futures.Future; cancelling that future
+    # cancels the task (and so closes its connection).
+    def __init__(self, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="ollama-engine", daemon=True)
+        self.thread.start()
+        self.engine = OllamaEngine(**kwargs)
+        self.engines = {}  # (base_url, api_key) -> OllamaEngine for other endpoints, see engine_for
+
+    @property
+    def base_url(self):
+        return self.engine.base_url
+
+    def engine_for(self, base_url, api_key=None):
+        # Engines for additional servers share this loop; each has its own pool
+        key = (base_url.rstrip("/"), api_key)
+        if key[0] == self.engine.base_url and api_key == self.engine.api_key:
+            return self.engine
+        engine = self.engines.get(key)
+        if engine is None:
+            engine = self.engines[key] = OllamaEngine(key[0], api_key=api_key)
+        return engine
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        return self.submit(coro).result(timeout)
+
+    def _iterate(self, agen):
+        items = queue.SimpleQueue()
+        done = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put(item)
+            except BaseException as e:
+                items.put(e)
+            finally:
+                items.put(done)
+
+        future = self.submit(pump())
+        try:
+            while True:
+                item = items.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Breaking out of the loop early cancels the stream
+            future.cancel()
+
+    def generate(self, model, prompt, **kwargs):
+        return self._iterate(self.engine.generate(model, prompt, **kwargs))
+
+    def chat(self, model, messages, **kwargs):
+        return self._iterate(self.engine.chat(model, messages, **kwargs))
+
+    def openai_chat(self, model, messages, **kwargs):
+        return self._iterate(self.engine.openai_chat(model, messages, **kwargs))
+
+    def preload(self, model, keep_alive=None, timeout=None, options=None):
+        return self.run(self.engine.preload(model, keep_alive, options), timeout)
+
+    def ps(self, timeout=None):
+        return self.run(self.engine.ps(), timeout)
+
+    def running_models(self, timeout=None):
+        return self.run(self.engine.running_models(), timeout)
+
+    def installed_models(self, timeout=None):
+        return self.run(self.engine.installed_models(), timeout)
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        try:
+            for engine in [self.engine] + list(self.engines.values()):
+                self.run(engine.aclose(), timeout=5)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+# --- Headless CLI ---
+
+async def _run_cli(args):
+    engine = OllamaEngine(args.url)
+    options = json.loads(args.options) if args.options else None
+
+    async def one(prompt, echo):
+        parts = []
+        messages = [{"role": "user", "content": prompt}]
+        if args.openai:
+            stream = engine.openai_chat(args.model, messages, options=options)
+        else:
+            stream = engine.chat(args.model, messages, options=options, keep_alive=args.keep_alive)
+        async for chunk in stream:
+            parts.append(chunk.text)
+            if echo:
+                sys.stdout.write(chunk.text)
+                sys.stdout.flush()
+        return "".join(parts)
+
+    try:
+        if len(args.prompts) == 1:
+            await one(args.prompts[0], echo=True)
+            print()
+        else:
+            # Several prompts run concurrently on this one loop
+            for prompt, answer in zip(args.prompts, await asyncio.gather(*(one(p, False) for p in args.prompts))):
+                print(f">>> {prompt}\n{answer}\n")
+    finally:
+        await engine.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("prompts", nargs="*", help="prompts to send (default: read one from stdin)")
+    parser.add_argument("-m", "--model", default="qwen3:0.6b")
+    parser.add_argument("--url", default=None, help="Ollama base URL (default: $OLLAMA_HOST or localhost:11434)")
+    parser.add_argument("--options", default=None, help='JSON generation options, e.g. \'{"num_ctx": 4096}\'')
+    parser.add_argument("--keep-alive", default="30m")
+    parser.add_argument("--openai", action="store_true",
+                        help="use the OpenAI-compatible /v1/chat/completions endpoint instead of /api/chat")
+    args = parser.parse_args()
+    if not args.prompts:
+        args.prompts = [sys.stdin.read().strip()]
+    try:
+        asyncio.run(_run_cli(args))
+    except (OllamaError, OSError) as e:
+        print(f"[Error: {e}]", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,24 @@
+import time
+
+STARTUP_T0 = time.perf_counter()  # for --profile-startup; keep this the first import
+
 import tkinter as tk
+import bisect
 import ctypes
+import hashlib
+import json
+import mmap
+import os
+import itertools
+import queue
+import re
+import struct
 import sys
+import threading
+
+# ollama_engine (and with it asyncio) is imported on a background thread once
+# the window is up; see ExperimentalOverlay.load_backend.
+IMPORTS_DONE = time.perf_counter()
 
 # --- Windows Specific Constants and Functions ---
 # User32.dll functions
@@ -17,8 +35,1082 @@ WDA_EXCLUDEFROMCAPTURE = 0x00000011 # Hex 11, Decimal 17
 GWL_EXSTYLE = -20
 WS_EX_TOOLWINDOW = 0x00000080  # Hide from ALT+TAB
 
-class ExperimentalOverlay:
+# --- Streaming render pipeline ---
+# Worker threads never touch Tk directly: they post events to a queue and the UI
+# drains it once per frame, so a burst of tokens becomes a single insert.
+RENDER_INTERVAL_MS = 16  # ~60 fps; anything up to ~33 ms still feels live
+SEPARATOR_LINE = "\n\n────────────────────────────────────────────\n\n"
+
+
+class StreamRenderer:
+    def __init__(self, root, view, interval_ms=RENDER_INTERVAL_MS):
+        self.root = root
+        self.view = view  # anything with render_batch(ops)
+        self.interval_ms = interval_ms
+        self.events = queue.SimpleQueue()
+        self.running = False
+        # Stats: one flush == one Tk callback that actually touched the widget
+        self.flushes = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.stream_lags = {}  # stream_id -> [total lag, flushes, max lag] for chunks
+
+    def post(self, kind, stream_id=None, text=""):
+        # Thread-safe. Chat kinds are "start", "chunk", "end" and "system";
+        # anything else is passed through to the view untouched.
+        self.events.put((kind, stream_id, text, time.perf_counter()))
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.root.after(self.interval_ms, self._tick)
+
+    def stop(self):
+        self.running = False
+
+    def _tick(self):
+        if not self.running:
+            return
+        self.drain()
+        self.root.after(self.interval_ms, self._tick)
+
+    def drain(self):
+        ops = []
+        oldest = None
+        while True:
+            try:
+                kind, stream_id, text, posted = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if oldest is None:
+                oldest = posted
+            # Merge consecutive chunks of the same stream into one insert
+            if kind == "chunk" and ops and ops[-1][0] == "chunk" and ops[-1][1] == stream_id:
+                ops[-1][2].append(text)
+            else:
+                ops.append((kind, stream_id, [text], posted))
+        if not ops:
+            return 0
+        self.view.render_batch([(kind, stream_id, "".join(parts) if kind == "chunk" else parts[0])
+                                for kind, stream_id, parts, _ in ops])
+        now = time.perf_counter()
+        lag = now - oldest
+        self.flushes += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        for kind, stream_id, _, posted in ops:
+            if kind == "chunk":
+                stats = self.stream_lags.setdefault(stream_id, [0.0, 0, 0.0])
+                stats[0] += now - posted
+                stats[1] += 1
+                stats[2] = max(stats[2], now - posted)
+        return len(ops)
+
+    def pop_stream_lag(self, stream_id):
+        # (mean, max) seconds between a chunk arriving and it being on screen
+        total, flushes, worst = self.stream_lags.pop(stream_id, (0.0, 0, 0.0))
+        return (total / flushes if flushes else 0.0), worst
+
+
+# --- Markdown formatting ---
+CODE_KEYWORDS = frozenset("""
+    and as async await break case catch class const continue def defer default del elif else enum except export
+    extends false False finally fn for from func function go if impl implements import in interface is lambda
+    let match new nil None not null or package pass private protected pub public raise return self static struct
+    super switch this throw true True try type typeof use var void while with yield
+""".split())
+MARKDOWN_TOKEN = re.compile(r"```|`|\w+|\n|[^`\w\n]+")
+MARKDOWN_HOLD_BACK = re.compile(r"(?<!`)`{1,2}\Z|(?<!\w)\w{1,64}\Z")
+
+
+class MarkdownStreamFormatter:
+    # Tags a reply as it streams in: ``` fences, `inline` code and keywords
+    # inside code blocks. Only the newly received text is scanned; the fence and
+    # inline state carry over, and a trailing partial word or backtick run is
+    # held back until the next chunk shows how it ends.
+    def __init__(self, base_tag="ai_msg"):
+        self.base = (base_tag,)
+        self.in_fence = False
+        self.fence_header = False  # rest of the ``` line, e.g. the language name
+        self.in_inline = False
+        self.pending = ""
+
+    def feed(self, text):
+        data = self.pending + text
+        held = MARKDOWN_HOLD_BACK.search(data)
+        if held:
+            self.pending = held.group(0)
+            data = data[:held.start()]
+        else:
+            self.pending = ""
+        return self._format(data)
+
+    def flush(self):
+        data, self.pending = self.pending, ""
+        return self._format(data)
+
+    def _tags(self, token):
+        if self.in_fence:
+            if self.fence_header:
+                return self.base + ("code_block", "code_fence")
+            if token in CODE_KEYWORDS:
+                return self.base + ("code_block", "code_keyword")
+            return self.base + ("code_block",)
+        if self.in_inline:
+            return self.base + ("code_inline",)
+        return self.base
+
+    def _format(self, data):
+        # Returns [(text, tags), ...] with neighbouring same-tag tokens merged
+        segments = []
+        for token in MARKDOWN_TOKEN.findall(data):
+            if token == "```":
+                tags = self.base + ("code_block", "code_fence")
+                self.in_fence = not self.in_fence
+                self.fence_header = self.in_fence
+                self.in_inline = False
+            elif token == "`" and not self.in_fence:
+                self.in_inline = not self.in_inline
+                tags = self.base + ("code_inline", "code_fence")
+            else:
+                if token == "\n":
+                    self.fence_header = False
+                    self.in_inline = False  # inline code never spans lines
+                tags = self._tags(token)
+            if segments and segments[-1][1] == tags:
+                segments[-1][0].append(token)
+            else:
+                segments.append(([token], tags))
+        return [("".join(parts), tags) for parts, tags in segments]
+
+
+def insert_args(segments):
+    # [(text, tags), ...] -> alternating arguments for one Text.insert call
+    args = []
+    for text, tags in segments:
+        args.append(text)
+        args.append(tags)
+    return tuple(args)
+
+
+# --- Chat transcript ---
+# The full history lives in a Transcript; the Text widget only holds the most
+# recent messages and older ones are paged back in when the user scrolls up.
+MAX_RENDERED_MESSAGES = 200
+HISTORY_PAGE_SIZE = 50
+
+
+class Transcript:
     def __init__(self):
+        self.messages = []  # [sender, text], oldest first
+        self.labels = {}    # index -> label shown after "AI", e.g. the model in race mode
+
+    def __len__(self):
+        return len(self.messages)
+
+    def add(self, sender, text="", label=""):
+        self.messages.append([sender, text])
+        if label:
+            self.labels[len(self.messages) - 1] = label
+        return len(self.messages) - 1
+
+    def set_text(self, index, text):
+        self.messages[index][1] = text
+
+
+class ChatView:
+    # Renders a Transcript into a tk.Text. Every rendered message i starts at
+    # mark "msg<i>", so trimming and paging are single range operations.
+    def __init__(self, text, max_rendered=MAX_RENDERED_MESSAGES, page_size=HISTORY_PAGE_SIZE):
+        self.text = text
+        self.transcript = Transcript()
+        self.max_rendered = max_rendered
+        self.page_size = page_size
+        self.first_rendered = 0  # transcript index of the oldest message in the widget
+        self.streams = {}        # stream_id -> (transcript index, received chunks, formatter)
+        self.paging = False
+        self.on_complete = None  # on_complete(index, stream_id) once a message's text is final
+        self.text.config(yscrollcommand=self._on_scroll)
+
+    @staticmethod
+    def _ai_label(label):
+        return f"AI [{label}]: " if label else "AI: "
+
+    def _message_chunks(self, index):
+        # Alternating text/tags arguments for a single Text.insert call
+        sender, text = self.transcript.messages[index]
+        if sender == "user":
+            return ("You: ", ("user_label",), text + "\n", ("user_msg",))
+        if sender == "ai":
+            formatter = MarkdownStreamFormatter()
+            body = formatter.feed(text + "\n") + formatter.flush()
+            label = self._ai_label(self.transcript.labels.get(index))
+            return (label, ("ai_label",)) + insert_args(body) + (SEPARATOR_LINE, ("separator",))
+        if sender == "system":
+            return (text + "\n", ("system_msg",), SEPARATOR_LINE, ("separator",))
+        return (text + "\n", ())
+
+    def append(self, text, sender, label=""):
+        at_bottom = self.text.yview()[1] >= 1.0
+        self.text.config(state="normal")
+        self._append_message(self.transcript.add(sender, text, label))
+        self._trim(at_bottom)
+        self.text.see(tk.END)
+        self.text.config(state="disabled")
+
+    def render_batch(self, ops):
+        at_bottom = self.text.yview()[1] >= 1.0
+        self.text.config(state="normal")
+        for kind, stream_id, text in ops:
+            if kind == "start":
+                self._begin_stream(stream_id, text)
+            elif kind == "chunk":
+                self._stream_append(stream_id, text)
+            elif kind == "end":
+                self._end_stream(stream_id)
+            elif kind == "system":
+                self._append_message(self.transcript.add("system", text))
+        self._trim(at_bottom)
+        self.text.see(tk.END)
+        self.text.config(state="disabled")
+
+    def _append_message(self, index):
+        start = self.text.index("end-1c")
+        self.text.insert(tk.END, *self._message_chunks(index))
+        self.text.mark_set(f"msg{index}", start)
+        if self.on_complete is not None:
+            self.on_complete(index, None)
+
+    def _begin_stream(self, stream_id, label=""):
+        # "AI: " plus the reply's closing newline; chunks go in between, at a
+        # mark of their own, so later messages can't end up inside the reply.
+        index = self.transcript.add("ai", label=label)
+        start = self.text.index("end-1c")
+        self.text.insert(tk.END, self._ai_label(label), ("ai_label",), "\n", ("ai_msg",))
+        self.text.mark_set(f"msg{index}", start)
+        self.text.mark_set(stream_id, "end-2c")
+        self.streams[stream_id] = (index, [], MarkdownStreamFormatter())
+
+    def _stream_append(self, stream_id, text):
+        entry = self.streams.get(stream_id)
+        if entry is None:
+            return
+        entry[1].append(text)
+        segments = entry[2].feed(text)
+        if segments:
+            self.text.insert(stream_id, *insert_args(segments))
+
+    def _end_stream(self, stream_id):
+        entry = self.streams.pop(stream_id, None)
+        if entry is None:
+            return
+        index, chunks, formatter = entry
+        segments = formatter.flush()
+        if segments:
+            self.text.insert(stream_id, *insert_args(segments))
+        self.transcript.set_text(index, "".join(chunks))
+        self.text.insert(f"{stream_id} +1c", SEPARATOR_LINE, ("separator",))
+        self.text.mark_unset(stream_id)
+        if self.on_complete is not None:
+            self.on_complete(index, stream_id)
+
+    def _trim(self, at_bottom):
+        # Leave history alone while the user is scrolled up reading it
+        if self.max_rendered is None or not at_bottom:
+            return
+        keep_from = len(self.transcript) - self.max_rendered
+        if self.streams:
+            # Never drop a reply that is still streaming
+            keep_from = min([keep_from] + [entry[0] for entry in self.streams.values()])
+        if keep_from <= self.first_rendered:
+            return
+        self.text.delete("1.0", f"msg{keep_from}")
+        for index in range(self.first_rendered, keep_from):
+            self.text.mark_unset(f"msg{index}")
+        self.first_rendered = keep_from
+
+    def _on_scroll(self, first, last):
+        if float(first) <= 0.0 and self.first_rendered > 0 and not self.paging:
+            self.paging = True
+            self.text.after_idle(self.page_older)
+
+    def page_older(self):
+        self.paging = False
+        count = min(self.page_size, self.first_rendered)
+        if not count:
+            return
+        anchor = f"msg{self.first_rendered}"
+        self.text.config(state="normal")
+        for index in range(self.first_rendered - 1, self.first_rendered - count - 1, -1):
+            self.text.insert("1.0", *self._message_chunks(index))
+            self.text.mark_set(f"msg{index}", "1.0")
+        self.first_rendered -= count
+        self.text.config(state="disabled")
+        # Keep the reader on the message they were looking at
+        self.text.yview(anchor)
+
+
+# --- Transcript log ---
+# Every completed message is appended to a log file as one length-prefixed
+# JSON record, and a fixed-size (offset, length, session) entry goes into a
+# side ".idx" file. Restoring the tail reads a few index entries and slices
+# those records out of a memory map, however long the history is. Records with
+# sender "history" aren't shown: they note which turns the chat history kept
+# (answers next to their question's turn id) and which it took back, and the
+# history is rebuilt from those rather than from what was displayed.
+# OVERLAY_TRANSCRIPT moves the log; set it to "" to turn logging off
+TRANSCRIPT_LOG_PATH = os.environ.get("OVERLAY_TRANSCRIPT",
+                                     os.path.join(os.path.expanduser("~"), ".overlay_ollama_transcript.log")) or None
+RESTORE_MESSAGES = 60
+SEARCH_RESULTS = 20
+TRANSCRIPT_LENGTH = struct.Struct("<I")
+TRANSCRIPT_INDEX_ENTRY = struct.Struct("<QII")
+
+
+class TranscriptLog:
+    def __init__(self, path=TRANSCRIPT_LOG_PATH):
+        self.path = path
+        self.log = open(path, "ab+")
+        self.index = open(path + ".idx", "ab+")
+        self.count, self.end, last_session = self._recover()
+        self.session = last_session + 1
+
+    def _entry(self, i):
+        self.index.seek(i * TRANSCRIPT_INDEX_ENTRY.size)
+        return TRANSCRIPT_INDEX_ENTRY.unpack(self.index.read(TRANSCRIPT_INDEX_ENTRY.size))
+
+    def _recover(self):
+        # Log and index are written in that order without fsync, so after a
+        # crash the index may miss entries or the log may end in a torn record
+        log_size = os.fstat(self.log.fileno()).st_size
+        count = os.fstat(self.index.fileno()).st_size // TRANSCRIPT_INDEX_ENTRY.size
+        end, session = 0, 0
+        while count:
+            offset, length, session = self._entry(count - 1)
+            end = offset + TRANSCRIPT_LENGTH.size + length
+            if end <= log_size:
+                break
+            count -= 1
+            end, session = 0, 0
+        self.index.truncate(count * TRANSCRIPT_INDEX_ENTRY.size)
+        self.log.seek(end)
+        while end + TRANSCRIPT_LENGTH.size <= log_size:
+            (length,) = TRANSCRIPT_LENGTH.unpack(self.log.read(TRANSCRIPT_LENGTH.size))
+            data = self.log.read(length)
+            if len(data) < length:
+                break
+            try:
+                session = json.loads(data).get("session", session)
+            except ValueError:
+                break
+            self.index.write(TRANSCRIPT_INDEX_ENTRY.pack(end, length, session))
+            count += 1
+            end += TRANSCRIPT_LENGTH.size + length
+        if end < log_size:
+            print(f"Transcript log: dropped {log_size - end} bytes of a torn record")
+            self.log.truncate(end)
+        self.index.flush()
+        return count, end, session
+
+    def append(self, record):
+        record["session"] = self.session
+        data = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.log.write(TRANSCRIPT_LENGTH.pack(len(data)) + data)
+        self.log.flush()
+        self.index.write(TRANSCRIPT_INDEX_ENTRY.pack(self.end, len(data), self.session))
+        self.index.flush()
+        self.count += 1
+        self.end += TRANSCRIPT_LENGTH.size + len(data)
+
+    def start_session(self):
+        self.session += 1
+
+    def _map(self):
+        return mmap.mmap(self.log.fileno(), 0, access=mmap.ACCESS_READ) if self.end else None
+
+    def tail(self, n=RESTORE_MESSAGES):
+        # The newest n records, oldest first
+        first = max(0, self.count - n)
+        self.index.seek(first * TRANSCRIPT_INDEX_ENTRY.size)
+        raw = self.index.read((self.count - first) * TRANSCRIPT_INDEX_ENTRY.size)
+        view = self._map()
+        if view is None:
+            return []
+        try:
+            records = []
+            for offset, length, _ in TRANSCRIPT_INDEX_ENTRY.iter_unpack(raw):
+                start = offset + TRANSCRIPT_LENGTH.size
+                records.append(json.loads(view[start:start + length]))
+            return records
+        finally:
+            view.close()
+
+    def search(self, query, limit=SEARCH_RESULTS):
+        # Newest matches first. The regex runs over the mapped bytes; only
+        # records it hits are decoded, then checked against the message text.
+        view = self._map()
+        if view is None or not query:
+            return []
+        try:
+            self.index.seek(0)
+            offsets = [entry[0] for entry in TRANSCRIPT_INDEX_ENTRY.iter_unpack(self.index.read())]
+            # Records are stored JSON-encoded, so look for the query the way append()
+            # escapes it. IGNORECASE on bytes only folds ASCII, so spell out both
+            # cases of anything else.
+            encoded = json.dumps(query, ensure_ascii=False)[1:-1]
+            pattern = re.compile(b"".join(
+                re.escape(c.encode("utf-8")) if c.isascii() else
+                b"(?:" + b"|".join(re.escape(v.encode("utf-8")) for v in {c, c.lower(), c.upper()}) + b")"
+                for c in encoded), re.IGNORECASE)
+            needle = query.casefold()
+            results, seen = [], set()
+            for match in pattern.finditer(view, 0, self.end):
+                i = bisect.bisect_right(offsets, match.start()) - 1
+                if i < 0 or i in seen:
+                    continue
+                seen.add(i)
+                start = offsets[i] + TRANSCRIPT_LENGTH.size
+                (length,) = TRANSCRIPT_LENGTH.unpack(view[offsets[i]:start])
+                record = json.loads(view[start:start + length])
+                if record.get("sender") != "history" and needle in record.get("text", "").casefold():
+                    results.append(record)
+            return results[-limit:][::-1]
+        finally:
+            view.close()
+
+    def close(self):
+        self.log.close()
+        self.index.close()
+
+
+# --- Request scheduling ---
+MAX_CONCURRENT_REQUESTS = 2
+
+
+class Request:
+    def __init__(self, request_id):
+        self.id = request_id
+        self.stream_id = f"ai_stream_{request_id}"  # this request's own mark in the chat view
+        self.cancelled = threading.Event()
+        self.future = None
+        self.ran = False  # _run got as far as the event loop
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.future is not None:
+            # Cancels the task on the engine loop, which closes its connection
+            # so Ollama stops generating.
+            self.future.cancel()
+
+
+class RequestScheduler:
+    # Runs generations as tasks on the engine's event loop, at most
+    # max_concurrent at a time. Every request gets an id and its own output
+    # stream, and can be cancelled individually.
+    def __init__(self, engine, max_concurrent=MAX_CONCURRENT_REQUESTS):
+        self.engine = engine  # SyncEngine
+        self.max_concurrent = max_concurrent
+        self.active = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._slots = None  # asyncio.Semaphore, created on the engine loop
+
+    def submit(self, coro_func, on_skipped=None):
+        # on_skipped(request) runs if the request is cancelled before it starts
+        request = Request(next(self._ids))
+        with self._lock:
+            self.active[request.id] = request
+        request.future = self.engine.submit(self._run(coro_func, request, on_skipped))
+        request.future.add_done_callback(lambda _: self._finished(request, on_skipped))
+        return request
+
+    def _finished(self, request, on_skipped):
+        # Covers a request cancelled before its task ever ran on the loop
+        with self._lock:
+            self.active.pop(request.id, None)
+        if not request.ran and on_skipped is not None:
+            on_skipped(request)
+
+    async def _run(self, coro_func, request, on_skipped):
+        import asyncio  # already loaded by the engine; this runs on its loop
+        request.ran = True
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        started = False
+        try:
+            async with self._slots:
+                if not request.cancelled.is_set():
+                    started = True
+                    await coro_func(request)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Request {request.id} failed: {e}")
+        finally:
+            if not started and on_skipped is not None:
+                on_skipped(request)
+
+    def cancel(self, request_id):
+        with self._lock:
+            request = self.active.get(request_id)
+        if request is not None:
+            request.cancel()
+
+    def cancel_all(self):
+        with self._lock:
+            requests = list(self.active.values())
+        for request in requests:
+            request.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+
+
+# --- Generation metrics ---
+METRICS_HISTORY = 500
+METRICS_EXPORT_DIR = os.path.expanduser("~")
+METRICS_DEBUG = bool(os.environ.get("OVERLAY_METRICS_DEBUG"))  # also echo every record to stdout
+OLLAMA_TIMING_FIELDS = ("eval_count", "eval_duration", "prompt_eval_count", "prompt_eval_duration",
+                        "load_duration", "total_duration")
+
+
+class GenerationMetrics:
+    # Timestamps are time.perf_counter() values; Ollama's own durations are ns
+    def __init__(self, model, endpoint):
+        self.model = model
+        self.endpoint = endpoint
+        self.request_id = None
+        self.submitted = time.perf_counter()
+        self.started = None       # worker picked the request up
+        self.connected = None     # socket to the server ready (new or reused)
+        self.first_token = None
+        self.finished = None
+        self.chunks = 0
+        self.render_lag_mean = None
+        self.render_lag_max = None
+        self.cancelled = False
+        self.error = None
+        self.prefetch = None  # "hit", "partial" or "miss" when prefetch was on
+        self.race = None      # "won", "lost" or "error" for race mode contestants
+        self.ollama = {}
+
+    def capture_final(self, message):
+        # The last NDJSON line (done=true) carries Ollama's timings
+        for field in OLLAMA_TIMING_FIELDS:
+            if field in message:
+                self.ollama[field] = message[field]
+
+    @staticmethod
+    def _ms(start, end):
+        if start is None or end is None:
+            return None
+        return round((end - start) * 1000.0, 2)
+
+    def tokens_per_sec(self):
+        count, duration = self.ollama.get("eval_count"), self.ollama.get("eval_duration")
+        if count and duration:
+            return round(count / (duration / 1e9), 2)
+        if self.chunks and self.first_token and self.finished and self.finished > self.first_token:
+            return round(self.chunks / (self.finished - self.first_token), 2)
+        return None
+
+    def as_dict(self):
+        record = {
+            "time": time.time(),
+            "request_id": self.request_id,
+            "model": self.model,
+            "endpoint": self.endpoint,
+            "queue_delay_ms": self._ms(self.submitted, self.started),
+            "connect_ms": self._ms(self.started, self.connected),
+            "ttft_ms": self._ms(self.submitted, self.first_token),
+            "total_ms": self._ms(self.submitted, self.finished),
+            "tokens_per_sec": self.tokens_per_sec(),
+            "chunks": self.chunks,
+            "render_lag_mean_ms": None if self.render_lag_mean is None else round(self.render_lag_mean * 1000.0, 2),
+            "render_lag_max_ms": None if self.render_lag_max is None else round(self.render_lag_max * 1000.0, 2),
+            "cancelled": self.cancelled,
+            "error": self.error,
+            "prefetch": self.prefetch,
+            "race": self.race,
+        }
+        for field in OLLAMA_TIMING_FIELDS:
+            record[field] = self.ollama.get(field)
+        return record
+
+
+class MetricsLog:
+    # Rolling window of finished generations, summarised per model
+    def __init__(self, maxlen=METRICS_HISTORY):
+        from collections import deque
+        self.records = deque(maxlen=maxlen)
+
+    def add(self, metrics):
+        record = metrics.as_dict()
+        self.records.append(record)
+        return record
+
+    def summary(self):
+        by_model = {}
+        for record in self.records:
+            if record["error"] or record["cancelled"]:
+                continue
+            by_model.setdefault(record["model"], []).append(record)
+        lines = []
+        for model, records in sorted(by_model.items()):
+            def median(field):
+                values = sorted(r[field] for r in records if r[field] is not None)
+                return values[len(values) // 2] if values else None
+
+            def fmt(value, unit):
+                return "-" if value is None else f"{value:.0f}{unit}"
+            lines.append(f"{model}  n={len(records)}  ttft {fmt(median('ttft_ms'), 'ms')}  "
+                         f"{fmt(median('tokens_per_sec'), ' tok/s')}  total {fmt(median('total_ms'), 'ms')}")
+        return "\n".join(lines) or "No completed generations yet."
+
+    def export_jsonl(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for record in self.records:
+                f.write(json.dumps(record) + "\n")
+        return path
+
+    def export_csv(self, path):
+        import csv
+        records = list(self.records)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            if records:
+                writer = csv.DictWriter(f, fieldnames=list(records[0].keys()))
+                writer.writeheader()
+                writer.writerows(records)
+        return path
+
+
+# --- Conversation mode ---
+SYSTEM_INSTRUCTION = (
+    "You are an AI assistant helping with real-time interview questions for an experienced Software Development Engineer (SDE). "
+    "Always answer as quickly as possible, be concise and to the point, but ensure your answers are informative and demonstrate depth of knowledge. "
+    "If the question is technical, give a direct, expert-level answer first, then a brief but insightful explanation. "
+    "Do not use <think> or similar tags in your response. "
+    "If you output code, always format it as a single code block between triple backticks (```), and do not add extra commentary inside the code block."
+)
+KEEP_ALIVE = "30m"            # how long Ollama keeps the model resident after a request
+CONTEXT_TOKEN_BUDGET = 3000   # rough token budget for the history sent to /api/chat
+SUMMARY_MAX_CHARS = 600
+
+# --- Startup / config ---
+# Optional JSON file, e.g. {"models": ["qwen3:0.6b"], "default_model": "qwen3:0.6b"}
+CONFIG_PATH = os.environ.get("OVERLAY_CONFIG", os.path.join(os.path.expanduser("~"), ".overlay_ollama.json"))
+DEFAULT_CONFIG = {
+    # Shown until /api/tags answers, or if Ollama isn't reachable at startup
+    "models": [
+        "deepseek-r1:14b",
+        "deepseek-r1:7b",
+        "deepseek-r1:32b",
+        "llama4:latest",
+        "qwen3:0.6b",
+        "granite3.3:8b",
+        "granite3.3:2b",
+        "granite3.2-vision:latest",
+    ],
+    "default_model": "deepseek-r1:7b",
+    "use_installed_models": True,  # replace the list with what /api/tags reports
+    "prefetch": False,  # warm the prompt while typing (see PREFETCH_*)
+    # Race mode sends each prompt to all of these at once. An entry is an Ollama
+    # model name, or {"name": ..., "url": "http://host:port/v1", "model": ...,
+    # "api": "openai", "api_key": ...} for an OpenAI-compatible local server.
+    "race_targets": [],
+    "race_win_tokens": 12,      # first to stream this many chunks wins, the rest are cancelled (0 = never)
+    "race_side_by_side": False,  # show every contestant's answer, not just the leader's
+    "race_max_concurrent": 2,    # contestants generating at once; keep low on small machines
+    # Ollama options per model, e.g. {"qwen3:0.6b": {"num_ctx": 4096, "num_thread": 6}};
+    # "*" applies to every model. --autotune fills in num_thread and num_ctx.
+    "model_options": {},
+}
+MODEL_LIST_TIMEOUT = 5  # seconds
+BACKEND_WAIT_MS = 50    # how often a send made during startup checks for the engine again
+
+
+def load_config(path=CONFIG_PATH):
+    config = dict(DEFAULT_CONFIG)
+    try:
+        with open(path, encoding="utf-8") as f:
+            config.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        print(f"Ignoring config {path}: {e}")
+    return config
+
+
+def save_config(updates, path=CONFIG_PATH):
+    # Merged into what's on disk so keys the user wrote by hand are kept
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = {}
+    config.update(updates)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp, path)
+
+
+def options_for(config, model):
+    # The "*" profile overlaid with the model's own; None when there are none
+    profiles = config.get("model_options") or {}
+    options = dict(profiles.get("*") or {})
+    options.update(profiles.get(model) or {})
+    return options or None
+
+
+# --- Model warm-up ---
+PRELOAD_DELAY_MS = 300            # debounce for quick successive menu picks
+MODEL_STATUS_POLL_MS = 30000      # how often /api/ps is checked for evictions
+MODEL_STATUS_COLORS = {
+    "loading": "#eab308",
+    "ready": "#22c55e",
+    "evicted": "#8b8b8b",
+    "error": "#c50f1f",
+}
+
+
+class Conversation:
+    # History for /api/chat. The system message always comes first and never
+    # changes, so Ollama can reuse the KV cache for that prefix on every turn.
+    def __init__(self, system=SYSTEM_INSTRUCTION, token_budget=CONTEXT_TOKEN_BUDGET):
+        self.system = system
+        self.token_budget = token_budget
+        self.turns = []    # (turn id, role, content, tokens), oldest first
+        self.tokens = 0
+        self.summary = ""  # one line per dropped user question
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # Called with a transcript record whenever a turn is settled in or taken
+        # back, from whichever thread did it; see ExperimentalOverlay.log_history
+        self.on_change = None
+
+    @staticmethod
+    def estimate_tokens(text):
+        # ~4 chars per token is close enough for budgeting
+        return len(text) // 4 + 1
+
+    def add(self, role, content, reply_to=None):
+        # Returns the new turn's id. With reply_to (a user turn's id) the answer
+        # goes right after its question, even if more questions were sent while
+        # it streamed; it is dropped if that question was trimmed meanwhile.
+        with self._lock:
+            position = len(self.turns)
+            if reply_to is not None:
+                position = next((i + 1 for i, turn in enumerate(self.turns) if turn[0] == reply_to), None)
+                if position is None:
+                    return None
+            turn_id = next(self._ids)
+            tokens = self.estimate_tokens(content)
+            self.turns.insert(position, (turn_id, role, content, tokens))
+            self.tokens += tokens
+            if self.on_change is not None:
+                record = {"time": time.time(), "sender": "history", "turn": turn_id, "role": role, "text": content}
+                if reply_to is not None:
+                    record["reply_to"] = reply_to
+                self.on_change(record)
+            if self.tokens > self.token_budget:
+                self._trim()
+            return turn_id
+
+    def discard(self, turn_id):
+        # Takes back a question whose request failed or was skipped
+        with self._lock:
+            for i, turn in enumerate(self.turns):
+                if turn[0] == turn_id:
+                    self.tokens -= turn[3]
+                    del self.turns[i]
+                    if self.on_change is not None:
+                        self.on_change({"time": time.time(), "sender": "history", "discard": turn_id})
+                    return
+
+    def _trim(self):
+        # Trim down to half the budget rather than just under it: every trim
+        # shifts the prompt and costs a re-prefill, so do it rarely.
+        dropped = []
+        while len(self.turns) > 1 and self.tokens > self.token_budget // 2:
+            _, role, content, tokens = self.turns.pop(0)
+            self.tokens -= tokens
+            if role == "user":
+                dropped.append(" ".join(content.split())[:80])
+        if dropped:
+            lines = (self.summary.splitlines() + dropped)
+            summary = "\n".join(lines)
+            while len(summary) > SUMMARY_MAX_CHARS and len(lines) > 1:
+                lines.pop(0)
+                summary = "\n".join(lines)
+            self.summary = summary
+
+    def messages(self):
+        with self._lock:
+            messages = [{"role": "system", "content": self.system}]
+            if self.summary:
+                messages.append({"role": "system",
+                                 "content": "Earlier in this conversation the user asked about:\n" + self.summary})
+            messages.extend({"role": role, "content": content} for _, role, content, _ in self.turns)
+            return messages
+
+    def clear(self):
+        with self._lock:
+            self.turns = []
+            self.tokens = 0
+            self.summary = ""
+
+
+# --- Response cache ---
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_BYTES = 4 * 1024 * 1024
+CACHE_DB_PATH = os.path.join(os.path.expanduser("~"), ".overlay_ollama_cache.sqlite3")  # None = memory only
+CACHE_DB_MAX_ENTRIES = 5000
+
+
+class ResponseCache:
+    # LRU of finished answers keyed by model + options + normalised prompt
+    # (+ the chat history it was asked in), bounded by entry count and total
+    # size. Optionally backed by SQLite so answers survive restarts; the
+    # in-memory LRU stays the hot path and disk writes go through a writer thread.
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, path=None,
+                 max_disk_entries=CACHE_DB_MAX_ENTRIES):
+        from collections import OrderedDict
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_disk_entries = max_disk_entries
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.db = None
+        self._writes = None
+        if path:
+            import sqlite3
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS responses "
+                            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)")
+            self.db.commit()
+            self._writes = queue.SimpleQueue()
+            self._writer = threading.Thread(target=self._write_loop, name="response-cache", daemon=True)
+            self._writer.start()
+
+    @staticmethod
+    def normalize(text):
+        # Case, whitespace and trailing punctuation don't change the question
+        return " ".join(text.lower().split()).rstrip("?!. ")
+
+    def make_key(self, model, options, prompt, history=None):
+        # history: the chat messages the prompt follows, so "why?" in one
+        # conversation never replays the answer given in another
+        raw = json.dumps([model, options or {}, self.normalize(prompt), history or []], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            elif self.db is not None:
+                row = self.db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+                if row:
+                    value = row[0]
+                    self._writes.put(("touch", key, None, time.time()))
+                    self._remember(key, value)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        # Called from the engine loop: memory only here, the disk write is queued
+        with self._lock:
+            self._remember(key, value)
+        if self._writes is not None:
+            self._writes.put(("put", key, value, time.time()))
+
+    def _write_loop(self):
+        while True:
+            batch = [self._writes.get()]
+            while batch[-1] is not None:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            with self._lock:
+                if self.db is None:
+                    return
+                for op in batch:
+                    if op is None:
+                        continue
+                    kind, key, value, used = op
+                    if kind == "put":
+                        self.db.execute("INSERT OR REPLACE INTO responses (key, value, used) VALUES (?, ?, ?)",
+                                        (key, value, used))
+                    else:
+                        self.db.execute("UPDATE responses SET used = ? WHERE key = ?", (used, key))
+                if any(op is not None and op[0] == "put" for op in batch):
+                    self.db.execute("DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses "
+                                    "ORDER BY used DESC LIMIT ?)", (self.max_disk_entries,))
+                self.db.commit()
+            if batch[-1] is None:
+                return
+
+    def _remember(self, key, value):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= len(old.encode("utf-8"))
+        self.entries[key] = value
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= len(evicted.encode("utf-8"))
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.bytes}
+
+    def close(self):
+        if self._writes is not None:
+            # Let queued writes land first
+            self._writes.put(None)
+            self._writer.join(timeout=5)
+            self._writes = None
+        with self._lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+# --- Speculative prefetch ---
+# While the user types, the draft is sent ahead with generation capped so
+# Ollama only evaluates the prompt into its KV cache. When the message is sent
+# the shared prefix is already cached and only decoding is left.
+PREFETCH_DEBOUNCE_MS = 350
+PREFETCH_MIN_CHARS = 12
+# num_predict 0 means "model default" on some Ollama versions, so ask for one token
+PREFETCH_OPTIONS = {"num_predict": 1}
+
+
+class SpeculativeDraft:
+    def __init__(self, text, model):
+        self.text = text
+        self.model = model
+        self.request = None
+        self.done = False
+        self.cancelled = False
+        self.prompt_tokens = 0  # prompt_eval_count reported by Ollama
+
+
+class PrefetchStats:
+    # hit: the sent message was exactly a prefetched draft; partial: it
+    # extended one, so that prefix was cached; miss: nothing usable was warm.
+    # Wasted drafts were cancelled or didn't prefix what was finally sent.
+    def __init__(self):
+        self.issued = 0
+        self.hits = 0
+        self.partial = 0
+        self.misses = 0
+        self.cancelled = 0
+        self.wasted = 0
+        self.wasted_prompt_tokens = 0
+
+    def summary(self):
+        sends = self.hits + self.partial + self.misses
+        rate = f"{(self.hits + self.partial) * 100.0 / sends:.0f}%" if sends else "-"
+        return (f"Prefetch: {self.issued} drafts, hit {self.hits} / partial {self.partial} / miss {self.misses} "
+                f"({rate}), wasted {self.wasted} ({self.cancelled} cancelled, "
+                f"{self.wasted_prompt_tokens} prompt tokens)")
+
+
+# --- Race mode ---
+# One prompt goes to several models or endpoints. The first contestant to
+# stream text leads and is shown; the first to reach race_win_tokens chunks
+# wins and the others are cancelled, which also skips any still queued.
+
+
+class RaceTarget:
+    def __init__(self, name, model, url=None, api="ollama", api_key=None):
+        self.name = name
+        self.model = model
+        self.url = url  # None = the overlay's own Ollama server
+        self.api = api
+        self.api_key = api_key
+
+    @classmethod
+    def from_config(cls, entry):
+        if isinstance(entry, str):
+            return cls(entry, entry)
+        model = entry.get("model") or entry["name"]
+        return cls(entry.get("name") or model, model, entry.get("url"), entry.get("api", "ollama"),
+                   entry.get("api_key"))
+
+
+class RaceEntrant:
+    def __init__(self, target, metrics):
+        self.target = target
+        self.metrics = metrics
+        self.request = None
+        self.parts = []
+        self.shown = False  # has a region in the chat view
+        self.done = False
+
+
+class Race:
+    def __init__(self, entrants, win_tokens, side_by_side, turn):
+        self.entrants = entrants
+        self.win_tokens = win_tokens
+        self.side_by_side = side_by_side
+        self.turn = turn  # chat mode: the question's turn id; the winner's answer goes after it
+        self.leader = None
+        self.winner = None
+        self.pending = len(entrants)
+        self._lock = threading.Lock()
+
+    def entrant_done(self, entrant):
+        # True for the call that finishes the race
+        with self._lock:
+            if entrant.done:
+                return False
+            entrant.done = True
+            self.pending -= 1
+            return self.pending == 0
+
+
+class RaceStats:
+    # Per-target outcomes across races, to help pick a default model
+    def __init__(self):
+        self.targets = {}  # name -> {"races", "wins", "leads", "errors", "ttft_ms": [...]}
+
+    def record(self, name, won, led, error, ttft_ms):
+        stats = self.targets.setdefault(name, {"races": 0, "wins": 0, "leads": 0, "errors": 0, "ttft_ms": []})
+        stats["races"] += 1
+        stats["wins"] += bool(won)
+        stats["leads"] += bool(led)
+        stats["errors"] += bool(error)
+        if ttft_ms is not None:
+            stats["ttft_ms"].append(ttft_ms)
+
+    def summary(self):
+        lines = []
+        for name, stats in sorted(self.targets.items(), key=lambda item: -item[1]["wins"]):
+            ttfts = sorted(stats["ttft_ms"])
+            ttft = f"{ttfts[len(ttfts) // 2]:.0f}ms" if ttfts else "-"
+            lines.append(f"Race {name}  wins {stats['wins']}/{stats['races']}  led {stats['leads']}  "
+                         f"errors {stats['errors']}  ttft {ttft}")
+        return "\n".join(lines)
+
+
+class ExperimentalOverlay:
+    def __init__(self, config_path=CONFIG_PATH, transcript_path=TRANSCRIPT_LOG_PATH):
+        self.startup_times = {"init": time.perf_counter()}
+        self.config = load_config(config_path)
+        self.transcript_path = transcript_path  # None = no transcript log
         self.root = tk.Tk()
         self.root.title("Experimental Overlay")
         self.root.geometry("400x550+200+200")
@@ -27,7 +1119,8 @@ class ExperimentalOverlay:
 
         self.root.configure(bg="#23272e")
         self.root.wm_attributes('-alpha', 0.92)  # Make window slightly see-through
-        self.root.wm_attributes('-transparentcolor', '#1a1a1a')  # For more transparency on some systems
+        if sys.platform == "win32":
+            self.root.wm_attributes('-transparentcolor', '#1a1a1a')  # For more transparency on some systems
 
         # --- Modern Dark Theme Styles ---
         dark_bg = "#23272e"
@@ -38,30 +1131,64 @@ class ExperimentalOverlay:
         button_fg = "#f1f1f1"
         border_color = "#444857"
         accent2 = "#0078d4"  # Windows 11 blue accent
+        self.theme = {"bg": dark_bg, "fg": text_fg, "button_bg": button_bg, "button_fg": button_fg, "accent": accent2}
+        self.init_state()
 
         label = tk.Label(self.root, text="Try to screenshot this window's content!\n(Windows Only Experiment)",
                          font=("Segoe UI", 13, "bold"), padx=20, pady=20, bg=dark_bg, fg=text_fg)
         label.pack(expand=False, fill="x")
 
         # --- Model Selection ---
-        self.available_models = [
-            "deepseek-r1:14b",
-            "deepseek-r1:7b",
-            "deepseek-r1:32b",
-            "llama4:latest",
-            "qwen3:0.6b",
-            "granite3.3:8b",
-            "granite3.3:2b",
-            "granite3.2-vision:latest"
-        ]
-        self.selected_model = tk.StringVar(value="deepseek-r1:7b")
+        # Starts from the config list; replaced by the installed models once /api/tags answers
+        self.available_models = list(self.config["models"])
+        self.selected_model = tk.StringVar(value=self.config["default_model"])
         model_frame = tk.Frame(self.root, bg=dark_bg)
         model_frame.pack(fill="x", padx=10, pady=(5,0))
         tk.Label(model_frame, text="Model:", bg=dark_bg, fg=text_fg, font=("Segoe UI", 10)).pack(side="left")
-        model_menu = tk.OptionMenu(model_frame, self.selected_model, *self.available_models)
-        model_menu.config(bg=accent, fg=text_fg, font=("Segoe UI", 10), highlightthickness=0, bd=0, activebackground=accent2, activeforeground=text_fg)
-        model_menu['menu'].config(bg=accent, fg=text_fg, font=("Segoe UI", 10))
-        model_menu.pack(side="left", padx=(5,0))
+        self.model_menu = tk.OptionMenu(model_frame, self.selected_model, *self.available_models)
+        self.model_menu.config(bg=accent, fg=text_fg, font=("Segoe UI", 10), highlightthickness=0, bd=0, activebackground=accent2, activeforeground=text_fg)
+        self.model_menu['menu'].config(bg=accent, fg=text_fg, font=("Segoe UI", 10))
+        self.model_menu.pack(side="left", padx=(5,0))
+
+        # Chat mode keeps history and sends it to /api/chat; off = stateless /api/generate
+        self.chat_mode = tk.BooleanVar(value=True)
+        tk.Checkbutton(model_frame, text="Chat", variable=self.chat_mode, bg=dark_bg, fg=text_fg,
+                       selectcolor=accent, activebackground=dark_bg, activeforeground=text_fg,
+                       font=("Segoe UI", 10), bd=0, highlightthickness=0).pack(side="left", padx=(8, 0))
+        # Response cache is opt-in and only created the first time it's enabled
+        self.use_cache = tk.BooleanVar(value=False)
+        self.cache_label = tk.StringVar(value="Cache")
+        tk.Checkbutton(model_frame, textvariable=self.cache_label, variable=self.use_cache, bg=dark_bg, fg=text_fg,
+                       selectcolor=accent, activebackground=dark_bg, activeforeground=text_fg,
+                       font=("Segoe UI", 10), bd=0, highlightthickness=0).pack(side="left", padx=(4, 0))
+        # Speculative prefill of the draft while typing; opt-in since it costs compute
+        self.prefetch = tk.BooleanVar(value=bool(self.config.get("prefetch")))
+        tk.Checkbutton(model_frame, text="Prefetch", variable=self.prefetch, bg=dark_bg, fg=text_fg,
+                       selectcolor=accent, activebackground=dark_bg, activeforeground=text_fg,
+                       font=("Segoe UI", 10), bd=0, highlightthickness=0).pack(side="left", padx=(4, 0))
+        tk.Button(model_frame, text="New chat", command=self.new_conversation,
+                  bg=button_bg, fg=button_fg, font=("Segoe UI", 9), bd=0,
+                  activebackground=accent2, activeforeground=text_fg, padx=8, cursor="hand2").pack(side="right")
+
+        # --- Model status / warm-up ---
+        status_frame = tk.Frame(self.root, bg=dark_bg)
+        status_frame.pack(fill="x", padx=10, pady=(2, 0))
+        self.model_status = tk.StringVar(value="")
+        self.model_status_label = tk.Label(status_frame, textvariable=self.model_status, bg=dark_bg,
+                                           fg=MODEL_STATUS_COLORS["evicted"], font=("Segoe UI", 9))
+        self.model_status_label.pack(side="left")
+        self.unload_previous = tk.BooleanVar(value=False)
+        tk.Checkbutton(status_frame, text="Unload previous model", variable=self.unload_previous,
+                       bg=dark_bg, fg=text_fg, selectcolor=accent, activebackground=dark_bg,
+                       activeforeground=text_fg, font=("Segoe UI", 9), bd=0,
+                       highlightthickness=0).pack(side="right")
+        # Race mode: contestants come from race_targets in the config file
+        self.race_mode = tk.BooleanVar(value=False)
+        tk.Checkbutton(status_frame, text="Race", variable=self.race_mode,
+                       bg=dark_bg, fg=text_fg, selectcolor=accent, activebackground=dark_bg,
+                       activeforeground=text_fg, font=("Segoe UI", 9), bd=0,
+                       highlightthickness=0).pack(side="right", padx=(0, 8))
+        self.selected_model.trace_add("write", self.on_model_change)
 
         # --- Chat UI ---
         chat_frame = tk.Frame(self.root, bg=dark_bg)
@@ -72,6 +1199,10 @@ class ExperimentalOverlay:
                                     bd=0, highlightthickness=1, highlightbackground=border_color)
         self.chat_display.pack(side="top", fill="both", expand=True, pady=(0, 8))
         self.setup_chat_tags()
+        self.chat_view = ChatView(self.chat_display)
+        # The transcript log is opened and replayed once the window is up
+        self.root.after_idle(self.restore_transcript)
+        self.root.bind("<Control-f>", self.search_transcript)
 
         entry_frame = tk.Frame(chat_frame, bg=dark_bg)
         entry_frame.pack(side="bottom", fill="x")
@@ -80,6 +1211,7 @@ class ExperimentalOverlay:
                                    font=("Segoe UI", 11), bd=0, highlightthickness=1, highlightbackground=border_color)
         self.user_entry.pack(side="left", fill="x", expand=True, padx=(0, 5), ipady=6)
         self.user_entry.bind("<Return>", self.send_message)
+        self.user_entry.bind("<KeyRelease>", self.on_draft_change)
 
         send_btn = tk.Button(entry_frame, text="Send", command=self.send_message,
                              bg=accent2, fg=button_fg, font=("Segoe UI", 10, "bold"),
@@ -87,7 +1219,6 @@ class ExperimentalOverlay:
         send_btn.pack(side="right")
 
         # --- Stop Button ---
-        self.stop_event = None
         stop_btn = tk.Button(entry_frame, text="Stop", command=self.stop_response,
                              bg="#c50f1f", fg=button_fg, font=("Segoe UI", 10, "bold"),
                              bd=0, activebackground="#a80000", activeforeground=text_fg, padx=10, pady=6, cursor="hand2")
@@ -98,9 +1229,43 @@ class ExperimentalOverlay:
                                  bd=0, activebackground="#c50f1f", activeforeground=text_fg, padx=10, pady=4, cursor="hand2")
         close_button.pack(pady=10)
 
+        # --- Stats panel (F2) ---
+        # Widgets are built on first use
+        self.root.bind("<F2>", self.toggle_stats_panel)
+
+        self.renderer.start()
+        self.load_backend()
+        self.root.after(MODEL_STATUS_POLL_MS, self.poll_model_status)
+        self.startup_times["window"] = time.perf_counter()
+
         # Apply after window is created and visible
         self.root.after(100, self.apply_anti_capture)
 
+    def init_state(self):
+        # Everything but the widgets and Tk variables; HeadlessOverlay in
+        # bench_overlay.py calls this as well, with fakes for those.
+        self.conversation = Conversation()
+        self.response_cache = None
+        self.prefetch_stats = PrefetchStats()
+        self.prefetch_job = None
+        self.drafts = []  # SpeculativeDraft since the last send
+        self.race_stats = RaceStats()
+        self.model_states = {}
+        self.active_model = None
+        self.preload_job = None
+        self.transcript_log = None  # opened in restore_transcript
+        self.stream_metrics = {}  # stream_id -> GenerationMetrics, for the metadata logged with each reply
+        self.metrics = MetricsLog()
+        self.metrics_by_stream = {}
+        self.stats_frame = None
+        self.stats_visible = False
+        self.renderer = StreamRenderer(self.root, self)
+        self.ollama = None
+        self.scheduler = None
+        self.race_scheduler = None
+        self.backend_ready = threading.Event()
+        self.backend_error = None  # set instead of backend_ready if the engine can't start
+
     def apply_anti_capture(self):
         if sys.platform == "win32":
             try:
@@ -164,6 +1329,15 @@ class ExperimentalOverlay:
                 print(f"Error resetting window properties: {e}")
 
     def on_close(self):
+        self.renderer.stop()
+        if self.backend_ready.is_set():
+            self.scheduler.shutdown()
+            self.race_scheduler.shutdown()
+            self.ollama.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        if self.transcript_log is not None:
+            self.transcript_log.close()
         self.reset_affinity()
         self.root.destroy()
 
@@ -172,24 +1346,83 @@ class ExperimentalOverlay:
         self.root.mainloop()
 
     def append_chat(self, text, sender="user", stream=False):
-        self.chat_display.config(state="normal")
-        separator_line = "\n\n────────────────────────────────────────────\n\n"
-        if sender == "user":
-            # User message formatting
-            self.chat_display.insert(tk.END, "You: ", ("user_label",))
-            self.chat_display.insert(tk.END, text + "\n", ("user_msg",))
-            # No separator after user message
-        elif sender == "ai":
-            self.chat_display.insert(tk.END, "AI: ", ("ai_label",))
-            self.chat_display.insert(tk.END, text + "\n", ("ai_msg",))
-            self.chat_display.insert(tk.END, separator_line, ("separator",))
-        elif sender == "system":
-            self.chat_display.insert(tk.END, text + "\n", ("system_msg",))
-            self.chat_display.insert(tk.END, separator_line, ("separator",))
+        self.chat_view.append(text, sender)
+
+    def render_batch(self, ops):
+        # Called by StreamRenderer on the UI thread with coalesced events
+        chat_ops = []
+        for op in ops:
+            if op[0] == "status":
+                self.set_model_state(op[1], op[2])
+            elif op[0] == "models":
+                self.set_available_models(op[2])
+            elif op[0] == "history":
+                self.log_history(op[2])
+            elif op[0] == "race":
+                # After this flush, so the contestants' render lag is in
+                self.root.after_idle(self.finish_race, op[2])
+            else:
+                chat_ops.append(op)
+                if op[0] == "end" and op[1] in self.metrics_by_stream:
+                    # Renderer lag stats for this flush are recorded after we return
+                    self.root.after_idle(self.finish_metrics, op[1])
+        if chat_ops:
+            self.chat_view.render_batch(chat_ops)
+
+    # --- Metrics ---
+
+    def finish_metrics(self, stream_id):
+        self.stream_metrics.pop(stream_id, None)  # a reply that never showed isn't logged
+        metrics = self.metrics_by_stream.pop(stream_id, None)
+        if metrics is None:
+            return
+        metrics.render_lag_mean, metrics.render_lag_max = self.renderer.pop_stream_lag(stream_id)
+        record = self.metrics.add(metrics)
+        if METRICS_DEBUG:
+            print(f"[metrics] {json.dumps(record)}")
+        if self.stats_visible:
+            self.refresh_stats_panel()
+
+    def refresh_stats_panel(self):
+        renderer = self.renderer
+        mean_lag = renderer.total_lag / renderer.flushes * 1000.0 if renderer.flushes else 0.0
+        self.stats_text.set(f"{self.metrics.summary()}\n"
+                            f"UI: {renderer.flushes} flushes, lag mean {mean_lag:.1f}ms / max {renderer.max_lag * 1000.0:.1f}ms\n"
+                            f"{self.prefetch_stats.summary()}"
+                            + (f"\n{self.race_stats.summary()}" if self.race_stats.targets else ""))
+
+    def build_stats_panel(self):
+        theme = self.theme
+        self.stats_frame = tk.Frame(self.root, bg=theme["bg"])
+        self.stats_text = tk.StringVar(value="")
+        tk.Label(self.stats_frame, textvariable=self.stats_text, bg=theme["bg"], fg=theme["fg"], justify="left",
+                 anchor="w", font=("Consolas", 9)).pack(fill="x")
+        for fmt in ("csv", "jsonl"):
+            tk.Button(self.stats_frame, text=f"Export {fmt.upper()}", command=lambda f=fmt: self.export_metrics(f),
+                      bg=theme["button_bg"], fg=theme["button_fg"], font=("Segoe UI", 9), bd=0,
+                      activebackground=theme["accent"], activeforeground=theme["fg"], padx=8,
+                      cursor="hand2").pack(side="left", padx=(0, 5), pady=(2, 4))
+
+    def toggle_stats_panel(self, event=None):
+        if self.stats_frame is None:
+            self.build_stats_panel()
+        if self.stats_visible:
+            self.stats_frame.pack_forget()
         else:
-            self.chat_display.insert(tk.END, text + "\n")
-        self.chat_display.see(tk.END)
-        self.chat_display.config(state="disabled")
+            self.refresh_stats_panel()
+            self.stats_frame.pack(fill="x", padx=10, pady=(0, 5))
+        self.stats_visible = not self.stats_visible
+
+    def export_metrics(self, fmt):
+        path = os.path.join(METRICS_EXPORT_DIR, time.strftime(f"overlay_metrics_%Y%m%d_%H%M%S.{fmt}"))
+        try:
+            if fmt == "csv":
+                self.metrics.export_csv(path)
+            else:
+                self.metrics.export_jsonl(path)
+            self.append_chat(f"[Metrics exported to {path}]", sender="system")
+        except OSError as e:
+            self.append_chat(f"[Metrics export failed: {e}]", sender="system")
 
     def setup_chat_tags(self):
         # Call this after chat_display is created
@@ -199,6 +1432,132 @@ class ExperimentalOverlay:
         self.chat_display.tag_configure("ai_msg", foreground="#e0ffe0", font=("Segoe UI", 11, "normal"))
         self.chat_display.tag_configure("system_msg", foreground="#b0b0b0", font=("Segoe UI", 10, "italic"))
         self.chat_display.tag_configure("separator", foreground="#444857")
+        # Code tags are configured after ai_msg so they take priority over it
+        self.chat_display.tag_configure("code_block", font=("Consolas", 10), background="#1e2127")
+        self.chat_display.tag_configure("code_inline", font=("Consolas", 10), background="#2b303b")
+        self.chat_display.tag_configure("code_fence", foreground="#6b7280")
+        self.chat_display.tag_configure("code_keyword", foreground="#c678dd")
+
+    # --- Startup ---
+
+    def load_backend(self):
+        # Runs off the UI thread so the window is up before the engine (and
+        # asyncio) are imported; then fills the model menu from /api/tags.
+        def worker():
+            started = time.perf_counter()
+            try:
+                from ollama_engine import SyncEngine
+                self.startup_times["engine_import_ms"] = (time.perf_counter() - started) * 1000.0
+                ollama = SyncEngine()
+            except Exception as e:
+                # e.g. a malformed OLLAMA_HOST; sends report this instead of waiting forever
+                self.backend_error = f"{type(e).__name__}: {e}"
+                self.renderer.post("system", text=f"[Ollama engine unavailable: {self.backend_error}]")
+                self.renderer.post("models", text=None)
+                return
+            self.start_engine(ollama)
+            self.startup_times["backend"] = time.perf_counter()
+            models = None
+            if self.config.get("use_installed_models", True):
+                try:
+                    models = self.ollama.installed_models(timeout=MODEL_LIST_TIMEOUT)
+                except Exception as e:
+                    print(f"Could not list installed models: {e}")
+            self.renderer.post("models", text=models)
+        threading.Thread(target=worker, name="overlay-startup", daemon=True).start()
+
+    def start_engine(self, ollama):
+        self.ollama = ollama
+        self.scheduler = RequestScheduler(self.ollama)
+        self.race_scheduler = RequestScheduler(self.ollama, self.config["race_max_concurrent"])
+        self.backend_ready.set()
+
+    def backend_pending(self, retry, *args):
+        # The Tk thread never waits for the engine: until it is up, retry(*args)
+        # is rescheduled. Returns True if the caller should stop here (also when
+        # the engine failed to start, which is reported instead).
+        if self.backend_ready.is_set():
+            return False
+        if self.backend_error is None:
+            self.root.after(BACKEND_WAIT_MS, retry, *args)
+        else:
+            self.append_chat(f"[Ollama engine unavailable: {self.backend_error}]", sender="system")
+        return True
+
+    def set_available_models(self, models):
+        if models:
+            self.available_models = sorted(models)
+        menu = self.model_menu["menu"]
+        menu.delete(0, "end")
+        for name in self.available_models:
+            menu.add_command(label=name, command=tk._setit(self.selected_model, name))
+        self.startup_times["models"] = time.perf_counter()
+        if self.available_models and self.selected_model.get() not in self.available_models:
+            # Setting the variable fires on_model_change, which preloads it
+            default = self.config["default_model"]
+            self.selected_model.set(default if default in self.available_models else self.available_models[0])
+        else:
+            self.on_model_change()
+
+    # --- Model warm-up ---
+
+    def on_model_change(self, *_):
+        # Keep the chat history within the model's context, leaving half for the answer
+        num_ctx = (options_for(self.config, self.selected_model.get()) or {}).get("num_ctx")
+        self.conversation.token_budget = min(CONTEXT_TOKEN_BUDGET, num_ctx // 2) if num_ctx else CONTEXT_TOKEN_BUDGET
+        if self.preload_job is not None:
+            self.root.after_cancel(self.preload_job)
+        self.preload_job = self.root.after(PRELOAD_DELAY_MS, self.preload_selected_model)
+        self.set_model_state(self.selected_model.get(), self.model_states.get(self.selected_model.get(), "loading"))
+
+    def preload_selected_model(self):
+        self.preload_job = None
+        if self.backend_error is not None:
+            return
+        if not self.backend_ready.is_set():
+            # Picked a model before the engine finished loading; try again shortly
+            self.preload_job = self.root.after(PRELOAD_DELAY_MS, self.preload_selected_model)
+            return
+        model = self.selected_model.get()
+        previous = self.active_model
+        self.active_model = model
+        unload = previous if previous and previous != model and self.unload_previous.get() else None
+        self.set_model_state(model, "loading")
+        options = options_for(self.config, model)
+
+        async def preload():
+            # Status updates go through the render queue; Tk is only touched on the UI thread
+            try:
+                if unload:
+                    await self.ollama.engine.preload(unload, keep_alive=0)
+                    self.renderer.post("status", unload, "evicted")
+                await self.ollama.engine.preload(model, keep_alive=KEEP_ALIVE, options=options)
+                self.renderer.post("status", model, "ready")
+            except Exception as e:
+                print(f"Preload of {model} failed: {e}")
+                self.renderer.post("status", model, "error")
+        self.ollama.submit(preload())
+
+    def poll_model_status(self):
+        # Ollama evicts idle models once keep_alive runs out; reflect that in the UI
+        model = self.active_model
+
+        async def check():
+            try:
+                running = await self.ollama.engine.running_models()
+            except Exception:
+                return
+            if model not in running and self.model_states.get(model) == "ready":
+                self.renderer.post("status", model, "evicted")
+        if model and self.backend_ready.is_set():
+            self.ollama.submit(check())
+        self.root.after(MODEL_STATUS_POLL_MS, self.poll_model_status)
+
+    def set_model_state(self, model, state):
+        self.model_states[model] = state
+        if model == self.selected_model.get():
+            self.model_status.set(f"{model}: {state}")
+            self.model_status_label.config(fg=MODEL_STATUS_COLORS.get(state, MODEL_STATUS_COLORS["evicted"]))
 
     def send_message(self, event=None):
         user_text = self.user_entry.get().strip()
@@ -207,80 +1566,606 @@ class ExperimentalOverlay:
         self.append_chat(user_text, sender="user")
         self.user_entry.delete(0, tk.END)
         model = self.selected_model.get()
-        system_instruction = (
-            "You are an AI assistant helping with real-time interview questions for an experienced Software Development Engineer (SDE). "
-            "Always answer as quickly as possible, be concise and to the point, but ensure your answers are informative and demonstrate depth of knowledge. "
-            "If the question is technical, give a direct, expert-level answer first, then a brief but insightful explanation. "
-            "Do not use <think> or similar tags in your response. "
-            "If you output code, always format it as a single code block between triple backticks (```), and do not add extra commentary inside the code block."
-        )
-        full_prompt = f"{system_instruction}\n\nUser: {user_text}"
-        self.root.after(100, lambda: self.query_ollama(full_prompt, model))
-
-    def query_ollama(self, prompt, model=None):
-        import threading
-        def worker(stop_event):
-            import requests
+        prefetch = self.settle_prefetch(user_text, model)
+        if self.race_mode.get():
+            self.start_race(user_text)
+            return
+        # The 100 ms hand-off is skipped when the prompt is already warm
+        delay = 0 if prefetch in ("hit", "partial") else 100
+        options = options_for(self.config, model)
+        cache_key = None
+        if self.use_cache.get():
+            cache = self.get_response_cache()
+            history = self.conversation.messages() if self.chat_mode.get() else None
+            cache_key = cache.make_key(model, options, user_text, history)
+            cached = cache.get(cache_key)
+            self.update_cache_label()
+            if cached is not None:
+                # Replay through the normal stream path: no network trip at all
+                if self.chat_mode.get():
+                    self.conversation.add("user", user_text)
+                    self.conversation.add("assistant", cached)
+                self.renderer.post("start", "ai_stream")
+                self.renderer.post("chunk", "ai_stream", cached)
+                self.renderer.post("end", "ai_stream")
+                return
+        # Created now so the hand-off below counts towards queue delay
+        if self.chat_mode.get():
+            turn = self.conversation.add("user", user_text)
+            messages = self.conversation.messages()
+            metrics = GenerationMetrics(model, "/api/chat")
+            metrics.prefetch = prefetch
+            self.root.after(delay, lambda: self.query_ollama(None, model, messages=messages, options=options,
+                                                             cache_key=cache_key, metrics=metrics, reply_to=turn))
+        else:
+            full_prompt = self.generate_prompt(user_text)
+            metrics = GenerationMetrics(model, "/api/generate")
+            metrics.prefetch = prefetch
+            self.root.after(delay, lambda: self.query_ollama(full_prompt, model, options=options,
+                                                             cache_key=cache_key, metrics=metrics))
+
+    @staticmethod
+    def generate_prompt(user_text):
+        return f"{SYSTEM_INSTRUCTION}\n\nUser: {user_text}"
+
+    # --- Speculative prefetch ---
+
+    def on_draft_change(self, event=None):
+        if not self.prefetch.get():
+            return
+        if self.prefetch_job is not None:
+            self.root.after_cancel(self.prefetch_job)
+        self.prefetch_job = self.root.after(PREFETCH_DEBOUNCE_MS, self.prefetch_draft)
+
+    def prefetch_draft(self):
+        self.prefetch_job = None
+        text = self.user_entry.get().strip()
+        model = self.selected_model.get()
+        if len(text) < PREFETCH_MIN_CHARS or not self.backend_ready.is_set():
+            return
+        if self.drafts and self.drafts[-1].text == text and self.drafts[-1].model == model:
+            return
+        # Anything still prefilling is for an older draft; Ollama handles one
+        # prompt per model at a time, so let the newest one through
+        self.cancel_drafts(lambda draft: True)
+        draft = SpeculativeDraft(text, model)
+        # Exactly what send_message will send, so the whole prompt matches
+        messages = self.conversation.messages() + [{"role": "user", "content": text}] if self.chat_mode.get() else None
+        prompt = self.generate_prompt(text)
+        # Same num_ctx/num_thread as the real request, or Ollama would reload the model
+        options = dict(options_for(self.config, model) or {}, **PREFETCH_OPTIONS)
+
+        async def worker(request):
+            try:
+                if messages is not None:
+                    stream = self.ollama.engine.chat(model, messages, options=options, keep_alive=KEEP_ALIVE)
+                else:
+                    stream = self.ollama.engine.generate(model, prompt, options=options, keep_alive=KEEP_ALIVE)
+                async for chunk in stream:
+                    if chunk.done:
+                        draft.prompt_tokens = chunk.data.get("prompt_eval_count") or 0
+            except Exception as e:
+                print(f"Prefetch failed: {e}")
+            finally:
+                draft.done = True
+
+        draft.request = self.scheduler.submit(worker)
+        self.drafts.append(draft)
+        self.prefetch_stats.issued += 1
+
+    def cancel_drafts(self, should_cancel):
+        for draft in self.drafts:
+            if not draft.done and not draft.cancelled and should_cancel(draft):
+                draft.cancelled = True
+                self.scheduler.cancel(draft.request.id)
+                self.prefetch_stats.cancelled += 1
+                self.prefetch_stats.wasted += 1
+
+    def settle_prefetch(self, text, model):
+        # Scores the drafts typed since the last send. Returns "hit", "partial",
+        # "miss", or None if prefetch was off and nothing was sent ahead.
+        if self.prefetch_job is not None:
+            self.root.after_cancel(self.prefetch_job)
+            self.prefetch_job = None
+        drafts, self.drafts = self.drafts, []
+        if not drafts and not self.prefetch.get():
+            return None
+        stats = self.prefetch_stats
+        result = "miss"
+        for draft in drafts:
+            if draft.cancelled:
+                continue  # already counted as wasted
+            if draft.model == model and text.startswith(draft.text):
+                if draft.text == text:
+                    result = "hit"
+                elif result == "miss":
+                    result = "partial"
+            else:
+                if not draft.done:
+                    draft.cancelled = True
+                    self.scheduler.cancel(draft.request.id)
+                    stats.cancelled += 1
+                stats.wasted += 1
+                stats.wasted_prompt_tokens += draft.prompt_tokens
+        if result == "hit":
+            stats.hits += 1
+        elif result == "partial":
+            stats.partial += 1
+        else:
+            stats.misses += 1
+        return result
+
+    # --- Race mode ---
+
+    def start_race(self, user_text):
+        targets = [RaceTarget.from_config(entry) for entry in self.config["race_targets"]]
+        if not targets:
+            self.append_chat("[Race mode: add race_targets to the config file]", sender="system")
+            return
+        if self.chat_mode.get():
+            turn = self.conversation.add("user", user_text)
+            messages = self.conversation.messages()
+        else:
+            turn = messages = None
+        prompt = self.generate_prompt(user_text)
+        entrants = []
+        for target in targets:
+            endpoint = "/v1/chat/completions" if target.api == "openai" else \
+                "/api/chat" if messages is not None else "/api/generate"
+            entrants.append(RaceEntrant(target, GenerationMetrics(target.name, endpoint)))
+        race = Race(entrants, self.config["race_win_tokens"], self.config["race_side_by_side"], turn)
+        self.launch_race(race, prompt, messages)
+
+    def launch_race(self, race, prompt, messages):
+        if self.backend_pending(self.launch_race, race, prompt, messages):
+            if self.backend_error is not None and race.turn is not None:
+                self.conversation.discard(race.turn)
+            return
+        for entrant in race.entrants:
+            self.run_entrant(race, entrant, prompt, messages)
+
+    def entrant_stream(self, target, prompt, messages, on_connect):
+        engine = self.ollama.engine if target.url is None else self.ollama.engine_for(target.url, target.api_key)
+        options = options_for(self.config, target.model)
+        if target.api == "openai":
+            if messages is None:
+                messages = [{"role": "user", "content": prompt}]
+            return engine.openai_chat(target.model, messages, options=options, on_connect=on_connect)
+        if messages is not None:
+            return engine.chat(target.model, messages, options=options, keep_alive=KEEP_ALIVE,
+                               on_connect=on_connect)
+        return engine.generate(target.model, prompt, options=options, keep_alive=KEEP_ALIVE, on_connect=on_connect)
+
+    def show_entrant(self, race, entrant):
+        # Opens the entrant's region with whatever it has buffered so far
+        entrant.shown = True
+        label = entrant.target.name if race.side_by_side or len(race.entrants) > 1 else ""
+        self.renderer.post("start", entrant.request.stream_id, label)
+        if entrant.parts:
+            self.renderer.post("chunk", entrant.request.stream_id, "".join(entrant.parts))
+
+    def run_entrant(self, race, entrant, prompt, messages):
+        metrics = entrant.metrics
+
+        def on_connect(connection):
+            metrics.connected = time.perf_counter()
+
+        async def worker(request):
+            # All contestants run on the engine loop, so race state needs no lock
+            entrant.request = request
+            metrics.request_id = request.id
+            metrics.started = time.perf_counter()
+            try:
+                stream = self.entrant_stream(entrant.target, prompt, messages, on_connect)
+                async for chunk in stream:
+                    if chunk.done:
+                        metrics.capture_final(chunk.data)
+                    if not chunk.text:
+                        continue
+                    entrant.parts.append(chunk.text)
+                    metrics.chunks += 1
+                    if metrics.first_token is None:
+                        metrics.first_token = time.perf_counter()
+                    if race.leader is None:
+                        race.leader = entrant
+                    if entrant.shown:
+                        self.renderer.post("chunk", request.stream_id, chunk.text)
+                    elif race.side_by_side or race.leader is entrant:
+                        self.show_entrant(race, entrant)
+                    if race.winner is None and race.win_tokens and metrics.chunks >= race.win_tokens:
+                        self.declare_winner(race, entrant)
+                if race.winner is None and race.win_tokens and race.leader is entrant:
+                    # Finished before reaching race_win_tokens: a short answer still wins
+                    self.declare_winner(race, entrant)
+            except Exception as e:
+                status = getattr(e, "status", None)
+                metrics.error = f"[{entrant.target.name} error: {status}]" if status else \
+                    f"[{entrant.target.name} error: {e}]"
+            finally:
+                metrics.finished = time.perf_counter()
+                metrics.cancelled = request.cancelled.is_set()
+                if race.leader is entrant and race.winner is None and metrics.error:
+                    # The answer on screen died early; hand over to the best runner-up
+                    race.leader = None
+                    runners = [e for e in race.entrants if e is not entrant and e.parts and not e.metrics.error]
+                    if runners:
+                        race.leader = max(runners, key=lambda e: len(e.parts))
+                        if not race.leader.shown:
+                            self.show_entrant(race, race.leader)
+                            if race.leader.done:
+                                self.renderer.post("end", race.leader.request.stream_id)
+                if entrant.shown:
+                    self.renderer.post("end", request.stream_id)
+                if race.entrant_done(entrant):
+                    self.renderer.post("race", text=race)
+
+        def on_skipped(request):
+            metrics.request_id = request.id
+            metrics.cancelled = True
+            if race.entrant_done(entrant):
+                self.renderer.post("race", text=race)
+
+        entrant.request = self.race_scheduler.submit(worker, on_skipped)
+        self.stream_metrics[entrant.request.stream_id] = metrics
+        if race.winner is not None:
+            # Decided while the contestants were still being submitted
+            self.race_scheduler.cancel(entrant.request.id)
+
+    def declare_winner(self, race, entrant):
+        race.winner = entrant
+        if not entrant.shown:
+            # Overtaken: the answer on screen is cut off and the winner's shown
+            # instead, so what's displayed is what goes into the history
+            leader = race.leader
+            if leader is not None and leader.shown and leader.request is not None:
+                self.renderer.post("chunk", leader.request.stream_id, f"\n[cut off: {entrant.target.name} won the race]")
+            self.show_entrant(race, entrant)
+        for other in race.entrants:
+            if other is not entrant and other.request is not None:
+                self.race_scheduler.cancel(other.request.id)
+
+    def finish_race(self, race):
+        # UI thread, once every contestant has finished, failed or been skipped
+        winner = race.winner
+        if winner is None:
+            # Nobody reached race_win_tokens: the leader if it completed, else any complete answer
+            complete = [e for e in race.entrants if e.parts and not e.metrics.error and not e.metrics.cancelled]
+            winner = race.leader if race.leader in complete else (complete[0] if complete else None)
+        if winner is None:
+            errors = [e.metrics.error for e in race.entrants if e.metrics.error]
+            self.append_chat(errors[0] if errors else "[Race: no answer]", sender="system")
+            if race.turn is not None:
+                self.conversation.discard(race.turn)
+        elif race.turn is not None:
+            self.conversation.add("assistant", "".join(winner.parts), reply_to=race.turn)
+        for entrant in race.entrants:
+            metrics = entrant.metrics
+            if entrant.request is not None:
+                self.stream_metrics.pop(entrant.request.stream_id, None)
+            metrics.race = "won" if entrant is winner else "error" if metrics.error else "lost"
+            if entrant.request is not None:
+                metrics.render_lag_mean, metrics.render_lag_max = \
+                    self.renderer.pop_stream_lag(entrant.request.stream_id)
+            self.race_stats.record(entrant.target.name, entrant is winner, entrant is race.leader,
+                                   metrics.error, metrics._ms(metrics.submitted, metrics.first_token))
+            record = self.metrics.add(metrics)
+            if METRICS_DEBUG:
+                print(f"[metrics] {json.dumps(record)}")
+        if self.stats_visible:
+            self.refresh_stats_panel()
+
+    def get_response_cache(self):
+        if self.response_cache is None:
+            try:
+                self.response_cache = ResponseCache(path=CACHE_DB_PATH)
+            except Exception as e:
+                print(f"Response cache on disk unavailable ({e}), using memory only")
+                self.response_cache = ResponseCache()
+        return self.response_cache
+
+    def update_cache_label(self):
+        stats = self.response_cache.stats()
+        self.cache_label.set(f"Cache {stats['hits']}/{stats['hits'] + stats['misses']}")
+
+    def new_conversation(self):
+        self.conversation.clear()
+        self.append_chat("[New conversation]", sender="system")
+        if self.transcript_log is not None:
+            self.transcript_log.start_session()
+
+    # --- Transcript log ---
+
+    def restore_transcript(self):
+        if self.transcript_path is None:
+            return
+        try:
+            self.transcript_log = TranscriptLog(self.transcript_path)
+            # History entries are interleaved with the messages; read back
+            # further until there are enough messages to show
+            n = RESTORE_MESSAGES
+            while True:
+                records = self.transcript_log.tail(n)
+                shown = [record for record in records if record["sender"] != "history"]
+                if len(shown) >= RESTORE_MESSAGES or len(records) < n:
+                    break
+                n *= 2
+        except (OSError, ValueError) as e:
+            print(f"Transcript log unavailable: {e}")
+            self.transcript_log = None
+            return
+        # Set first so the restored turns are logged again, into this session
+        self.conversation.on_change = lambda record: self.renderer.post("history", text=record)
+        if records:
+            shown = shown[-RESTORE_MESSAGES:]
+            for record in shown:
+                self.chat_view.append(record["text"], record["sender"], record.get("label", ""))
+            # Only the latest session carries on as chat context; "New chat" started a fresh one
+            last_session = records[-1]["session"]
+            turns = {}  # logged turn id -> turn id now
+            for record in records:
+                if record["sender"] != "history" or record["session"] != last_session:
+                    continue
+                if "discard" in record:
+                    if turns.get(record["discard"]) is not None:
+                        self.conversation.discard(turns.pop(record["discard"]))
+                    continue
+                reply_to = record.get("reply_to")
+                if reply_to is not None and turns.get(reply_to) is None:
+                    continue  # its question is older than what was read back
+                turns[record["turn"]] = self.conversation.add(record["role"], record["text"],
+                                                              reply_to=turns.get(reply_to))
+            self.chat_view.append(f"[Restored {len(shown)} messages; Ctrl+F searches the full history]", "system")
+        self.chat_view.on_complete = self.log_message
+
+    def log_message(self, index, stream_id):
+        sender, text = self.chat_view.transcript.messages[index]
+        record = {"time": time.time(), "sender": sender, "text": text}
+        label = self.chat_view.transcript.labels.get(index)
+        if label:
+            record["label"] = label
+        metrics = self.stream_metrics.pop(stream_id, None)
+        if metrics is not None:
+            # Model, timings and token counts; the render lag isn't known yet
+            record["meta"] = {k: v for k, v in metrics.as_dict().items() if v is not None and k != "time"}
+        elif sender == "user":
+            record["meta"] = {"model": self.selected_model.get()}
+        self.append_transcript(record)
+
+    def log_history(self, record):
+        if self.conversation.on_change is not None:  # still logging
+            self.append_transcript(record)
+
+    def append_transcript(self, record):
+        try:
+            self.transcript_log.append(record)
+        except OSError as e:
+            print(f"Transcript log write failed, no longer logging: {e}")
+            self.chat_view.on_complete = None
+            self.conversation.on_change = None
+
+    def search_transcript(self, event=None):
+        if self.transcript_log is None:
+            return
+        from tkinter import simpledialog
+        query = simpledialog.askstring("Search transcript", "Find:", parent=self.root)
+        if not query:
+            return
+        results = self.transcript_log.search(query)
+        lines = [f"[{len(results)} matches for {query!r}" + (", newest first]" if results else "]")]
+        for record in results:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(record["time"]))
+            who = "You" if record["sender"] == "user" else "AI" if record["sender"] == "ai" else record["sender"]
+            text = " ".join(record["text"].split())
+            at = text.casefold().find(query.casefold())
+            lines.append(f"{when} {who}: {'…' if at > 40 else ''}{text[max(0, at - 40):at + 80]}")
+        # Shown but kept out of the log itself
+        on_complete, self.chat_view.on_complete = self.chat_view.on_complete, None
+        self.append_chat("\n".join(lines), sender="system")
+        self.chat_view.on_complete = on_complete
+
+    def query_ollama(self, prompt, model=None, messages=None, options=None, cache_key=None, metrics=None,
+                     reply_to=None):
+        model_to_use = model or self.selected_model.get() or "llama3"
+        if metrics is None:
+            metrics = GenerationMetrics(model_to_use, "/api/chat" if messages is not None else "/api/generate")
+
+        def on_connect(connection):
+            metrics.connected = time.perf_counter()
+
+        async def worker(request):
+            # Runs on the engine's event loop; cancelling the request cancels this task
+            metrics.request_id = request.id
+            metrics.started = time.perf_counter()
+            started = False
+            parts = []
             try:
-                url = "http://localhost:11434/api/generate"
-                model_to_use = model or getattr(self, 'selected_model', None)
-                if isinstance(model_to_use, tk.StringVar):
-                    model_to_use = model_to_use.get()
-                if not model_to_use:
-                    model_to_use = "llama3"
-                data = {"model": model_to_use, "prompt": prompt}
-                response = requests.post(url, json=data, timeout=120, stream=True)
-                if response.status_code == 200:
-                    ai_buffer = ""
-                    first_chunk = True
-                    def stream_append(chunk, first=False):
-                        self.chat_display.config(state="normal")
-                        if first:
-                            self.chat_display.insert(tk.END, "AI: ", ("ai_label",))
-                            self.chat_display.mark_set("ai_stream", tk.END)
-                        self.chat_display.insert("ai_stream", chunk, ("ai_msg",))
-                        self.chat_display.see(tk.END)
-                        self.chat_display.config(state="disabled")
-                    for line in response.iter_lines(decode_unicode=True):
-                        if stop_event.is_set():
-                            break
-                        if not line:
-                            continue
-                        try:
-                            import json
-                            resp_json = json.loads(line)
-                            chunk = resp_json.get("response", "")
-                            if chunk:
-                                ai_buffer += chunk
-                                if first_chunk:
-                                    self.root.after(0, lambda c=chunk: stream_append(c, first=True))
-                                    first_chunk = False
-                                else:
-                                    self.root.after(0, lambda c=chunk: stream_append(c))
-                        except Exception as e:
-                            print(f"Streaming parse error: {e}, line: {line}")
-                    # After streaming, add separator
-                    def finish_stream():
-                        self.chat_display.config(state="normal")
-                        separator_line = "\n\n────────────────────────────────────────────\n\n"
-                        self.chat_display.insert(tk.END, separator_line, ("separator",))
-                        self.chat_display.config(state="disabled")
-                    self.root.after(0, finish_stream)
+                if messages is not None:
+                    stream = self.ollama.engine.chat(model_to_use, messages, options=options,
+                                                     keep_alive=KEEP_ALIVE, on_connect=on_connect)
                 else:
-                    answer = f"[Ollama error: {response.status_code}]"
-                    self.root.after(0, lambda: self.append_chat(answer, sender="system"))
+                    stream = self.ollama.engine.generate(model_to_use, prompt, options=options,
+                                                         keep_alive=KEEP_ALIVE, on_connect=on_connect)
+                async for chunk in stream:
+                    if chunk.done:
+                        metrics.capture_final(chunk.data)
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        metrics.chunks += 1
+                        if not started:
+                            metrics.first_token = time.perf_counter()
+                            self.renderer.post("start", request.stream_id)
+                            started = True
+                        self.renderer.post("chunk", request.stream_id, chunk.text)
+                self.renderer.post("status", model_to_use, "ready")
+                # Only complete answers are cached, never ones cut off by Stop
+                if cache_key and parts:
+                    self.response_cache.put(cache_key, "".join(parts))
             except Exception as e:
-                answer = f"[Error: {e}]"
-                self.root.after(0, lambda: self.append_chat(answer, sender="system"))
-        self.stop_event = threading.Event()
-        threading.Thread(target=worker, args=(self.stop_event,), daemon=True).start()
+                status = getattr(e, "status", None)  # ollama_engine.OllamaError
+                metrics.error = f"[Ollama error: {status}]" if status else f"[Error: {e}]"
+                self.renderer.post("system", text=metrics.error)
+            finally:
+                metrics.finished = time.perf_counter()
+                metrics.cancelled = request.cancelled.is_set()
+                # Closes this request's output region and records what was shown
+                self.renderer.post("end", request.stream_id)
+                if messages is not None:
+                    if parts:
+                        self.conversation.add("assistant", "".join(parts), reply_to=reply_to)
+                    elif reply_to is not None:
+                        self.conversation.discard(reply_to)
+
+        def on_skipped(request):
+            metrics.request_id = request.id
+            metrics.cancelled = True
+            self.renderer.post("end", request.stream_id)
+            if reply_to is not None:
+                self.conversation.discard(reply_to)
+
+        if self.backend_pending(self.query_ollama, prompt, model, messages, options, cache_key, metrics, reply_to):
+            if self.backend_error is not None and reply_to is not None:
+                self.conversation.discard(reply_to)
+            return None
+        request = self.scheduler.submit(worker, on_skipped)
+        self.metrics_by_stream[request.stream_id] = metrics
+        self.stream_metrics[request.stream_id] = metrics
+        return request
 
     def stop_response(self):
-        if self.stop_event:
-            self.stop_event.set()
+        if self.backend_ready.is_set():
+            self.scheduler.cancel_all()
+            self.race_scheduler.cancel_all()
+
+# --- Autotune ---
+# Short calibration runs per model: first num_thread at the smallest context
+# that holds the chat history budget plus room for the reply, then num_ctx with
+# the fastest thread count. A bigger context costs memory and prefill for
+# history the overlay never sends, so it is only tried under --max-memory-gb,
+# and kept while it holds AUTOTUNE_SPEED_KEEP of the best speed and fits.
+AUTOTUNE_PROMPT = ("Explain in a few paragraphs how a hash map handles collisions, "
+                   "and compare open addressing with separate chaining.")
+AUTOTUNE_PREDICT = 64
+AUTOTUNE_RUNS = 2  # per setting; the best one counts, so a stray slow run doesn't
+AUTOTUNE_CTX = (2048, 4096, 8192, 16384)
+AUTOTUNE_CTX_NEEDED = 2 * CONTEXT_TOKEN_BUDGET  # the history gets half of num_ctx, see on_model_change
+AUTOTUNE_SPEED_KEEP = 0.9
+
+
+def autotune_threads():
+    cores = os.cpu_count() or 4
+    return sorted({max(1, cores // 4), max(1, cores // 2), max(1, cores * 3 // 4), cores})
+
+
+def autotune_measure(engine, model, options, runs=AUTOTUNE_RUNS):
+    # (tokens/sec, resident bytes) for one setting; the first run also pays for
+    # reloading the model with the new options, which eval_duration leaves out
+    options = dict(options, num_predict=AUTOTUNE_PREDICT, temperature=0, seed=1)
+    best = 0.0
+    for _ in range(runs):
+        final = {}
+        for chunk in engine.generate(model, AUTOTUNE_PROMPT, options=options, keep_alive=KEEP_ALIVE):
+            if chunk.done:
+                final = chunk.data
+        count, duration = final.get("eval_count"), final.get("eval_duration")
+        if count and duration:
+            best = max(best, count / (duration / 1e9))
+    size = next((m.get("size", 0) for m in engine.ps(timeout=10) if m.get("name") == model), 0)
+    return best, size
+
+
+def autotune_model(engine, model, max_memory=None):
+    print(f"{model}:")
+    contexts = [ctx for ctx in AUTOTUNE_CTX if ctx >= AUTOTUNE_CTX_NEEDED] or [AUTOTUNE_CTX[-1]]
+    base = contexts[0]
+    results = []
+    for threads in autotune_threads():
+        speed, size = autotune_measure(engine, model, {"num_thread": threads, "num_ctx": base})
+        print(f"  num_thread={threads:<3} num_ctx={base:<6} {speed:7.1f} tok/s  {size / 2**20:8.0f} MiB")
+        results.append((speed, threads))
+    best_speed, threads = max(results)
+    if not best_speed:
+        raise RuntimeError("no tokens generated")
+    num_ctx = base
+    if max_memory:
+        for ctx in contexts[1:]:
+            speed, size = autotune_measure(engine, model, {"num_thread": threads, "num_ctx": ctx})
+            print(f"  num_thread={threads:<3} num_ctx={ctx:<6} {speed:7.1f} tok/s  {size / 2**20:8.0f} MiB")
+            if speed < best_speed * AUTOTUNE_SPEED_KEEP or size > max_memory:
+                break
+            num_ctx = ctx
+    return {"num_thread": threads, "num_ctx": num_ctx}
+
+def autotune(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="overlay_ollama.py --autotune",
+                                     description="Calibrate num_thread/num_ctx per model and save them to the config")
+    parser.add_argument("models", nargs="*", help="default: every configured model that is installed")
+    parser.add_argument("--max-memory-gb", type=float, default=None, help="largest model footprint to accept; larger contexts are only tried when set")
+    parser.add_argument("--dry-run", action="store_true", help="print the settings without saving them")
+    args = parser.parse_args(argv)
+    from ollama_engine import SyncEngine
+    engine = SyncEngine()
+    config = load_config()
+    try:
+        installed = engine.installed_models(timeout=MODEL_LIST_TIMEOUT)
+        models = args.models or [m for m in config["models"] if m in installed]
+        if not models:
+            print(f"None of the configured models are installed on {engine.base_url}")
+            return 1
+        profiles = dict(config.get("model_options") or {})
+        max_memory = args.max_memory_gb * 2**30 if args.max_memory_gb else None
+        for model in models:
+            try:
+                tuned = autotune_model(engine, model, max_memory)
+            except Exception as e:
+                print(f"  skipped: {e}")
+                continue
+            print(f"  -> {tuned}")
+            # Tuned keys replace old ones; anything else in the profile (num_predict, ...) stays
+            profiles[model] = dict(profiles.get(model) or {}, **tuned)
+            # Leave the model unloaded rather than holding the last calibration setting
+            engine.preload(model, keep_alive=0)
+        if args.dry_run:
+            print(json.dumps({"model_options": profiles}, indent=2))
+        else:
+            save_config({"model_options": profiles})
+            print(f"Saved to {CONFIG_PATH}")
+    finally:
+        engine.close()
+    return 0
+
+
+def profile_startup(timeout=10.0):
+    # Opens the overlay, waits for the model list, prints a JSON breakdown and exits
+    overlay = ExperimentalOverlay()
+    times = overlay.startup_times
+
+    def interactive():
+        times["interactive"] = time.perf_counter()
+
+    def check():
+        if "models" in times or time.perf_counter() - times["init"] > timeout:
+            report = {"imports_ms": (IMPORTS_DONE - STARTUP_T0) * 1000.0}
+            for name in ("init", "window", "interactive", "backend", "models"):
+                if name in times:
+                    report[f"{name}_ms"] = (times[name] - STARTUP_T0) * 1000.0
+            report["engine_import_ms"] = times.get("engine_import_ms")
+            report["models"] = overlay.available_models
+            print(json.dumps(report, indent=2))
+            overlay.on_close()
+        else:
+            overlay.root.after(10, check)
+    overlay.root.after_idle(interactive)
+    overlay.root.after(10, check)
+    overlay.run()
+
 
 if __name__ == "__main__":
-    if sys.platform != "win32":
+    if "--profile-startup" in sys.argv:
+        profile_startup()
+    elif "--autotune" in sys.argv:
+        sys.exit(autotune(sys.argv[sys.argv.index("--autotune") + 1:]))
+    elif sys.platform != "win32":
         print("WARNING: This script contains Windows-specific experiments for anti-screenshot measures.")
         # Fallback for non-Windows to just show a normal window
         root = tk.Tk()